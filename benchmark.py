@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+
+"""
+benchmark
+=========
+Timings for skel2dix, on generated skeleton files.
+
+Generates a synthetic skeleton corpus, then times the parsers,
+`process()` for each dictionary type, `processLemmas()`, and holding
+the parsed corpus as a list of Entry or as an EntryStore.
+Reports lines/sec and peak memory, and can write the results as
+JSON, so runs can be compared between releases.
+
+Usage
+~~~~~
+From the commandline::
+
+    ./benchmark.py <options>
+
+Options include,
+
+-n : number of lines to generate (default 100000)
+-o : write results to this JSON file
+--corpus : only write a generated corpus to this path, no timings
+
+The corpus can be shaped with `--stanzaMix`, `--setRate`,
+`--setSize`, `--multiWordRate`, `--slashRate` and `--commentRate`.
+
+Peak memory is measured with `tracemalloc`, in a second run of each
+benchmark, so does not slow the timings.
+
+    :copyright: 2016 Rob Crowther
+    :license: GPL, see LICENSE for details.
+"""
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import tempfile
+import platform
+import argparse
+import tracemalloc
+
+import skel2dix
+
+
+defaultStanzaMix = 'n=6,adj=2,vblex=2,adv=1,pr=1'
+
+# letters for generated words
+letters = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def parseStanzaMix(mixStr):
+    """
+    Parse 'n=6,adj=2' to [('n', 6.0), ('adj', 2.0)].
+    Names must be keys in skel2dix.stanzas.
+    """
+    b = []
+    for item in mixStr.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in skel2dix.stanzas:
+            raise ValueError('stanza not in skel2dix.stanzas: {0}'.format(name))
+        b.append((name, float(weight) if weight else 1.0))
+    return b
+
+
+def mkVocabulary(rnd, size):
+    return [
+        ''.join(rnd.choice(letters) for _ in range(rnd.randint(3, 10)))
+        for _ in range(size)
+    ]
+
+
+def generateCorpus(
+    fOut,
+    lineCount,
+    stanzaMix,
+    setRate=0.4,
+    setSize=(2, 5),
+    multiWordRate=0.1,
+    slashRate=0.1,
+    commentRate=0.05,
+    stanzaLength=500,
+    vocabularySize=50000,
+    seed=1
+    ):
+    """
+    Write a synthetic skeleton file.
+    @param lineCount lines to write, including headers and comments
+    @param stanzaMix list of (stanza name, weight)
+    @param setRate chance a data line has a set on one side
+    @param setSize (min, max) marks in a set
+    @param multiWordRate chance a mark is two words
+    @param slashRate chance a paradigm is slashed, e.g. 'bab/y'
+    @param commentRate chance of a comment line, and separately of
+    a comment following data
+    @param stanzaLength data lines between stanza headers
+    @param vocabularySize number of distinct words. Small values
+    make repeated marks.
+    """
+    rnd = random.Random(seed)
+    words = mkVocabulary(rnd, vocabularySize)
+    names = [name for name, _ in stanzaMix]
+    weights = [weight for _, weight in stanzaMix]
+
+    def mark():
+        m = rnd.choice(words)
+        if rnd.random() < multiWordRate:
+            m = m + ' ' + rnd.choice(words)
+        return m
+
+    def pair():
+        m = mark()
+        if rnd.random() < slashRate:
+            return '.' + m + ' :bab/' + m[-1] + ' '
+        return '.' + m + ' :house '
+
+    def side(isSet):
+        if not isSet:
+            return pair()
+        n = rnd.randint(setSize[0], setSize[1])
+        return '{' + ' '.join('.' + mark() for _ in range(n)) + '} :house '
+
+    written = 0
+    while written < lineCount:
+        fOut.write('== ' + rnd.choices(names, weights)[0] + '\n')
+        written += 1
+        for _ in range(stanzaLength):
+            if written >= lineCount:
+                break
+            if rnd.random() < commentRate:
+                fOut.write('# generated comment\n')
+            else:
+                setSide = rnd.randint(0, 1) if rnd.random() < setRate else -1
+                line = side(setSide == 0) + side(setSide == 1)
+                if rnd.random() < commentRate:
+                    line += '# comment'
+                fOut.write(line + '\n')
+            written += 1
+
+
+def benchParse(parserClass, lines):
+    p = parserClass(skel2dix.Context(diagnostics=skel2dix.Diagnostics(quiet=True)))
+    for line in lines:
+        p.parse(line)
+
+
+def benchTargets(inPath, outDir, targets):
+    targetPaths = [
+        (target, os.path.join(outDir, 'out-{0}-{1}'.format(i, target.dictionaryType)))
+        for i, target in enumerate(targets)
+    ]
+    for _, outPath in targetPaths:
+        skel2dix._silentRemove(outPath)
+    # messages are not part of the benchmark
+    skel2dix.processTargets(
+        inPath,
+        targetPaths,
+        False,
+        diagnostics=skel2dix.Diagnostics(quiet=True)
+        )
+
+
+def benchHold(inPath, collect):
+    # parse the whole corpus into memory, for the peak memory figure
+    context = skel2dix.Context(diagnostics=skel2dix.Diagnostics(quiet=True))
+    with open(inPath, 'r') as f:
+        entries = collect(f, context)
+    return len(entries)
+
+
+def mkBenchmarks(inPath, outDir):
+    """
+    @return a list of (name, function)
+    """
+    with open(inPath, 'r') as f:
+        dataLines = [
+            l.strip() for l in f
+            if l.strip() and l.strip()[0] not in '#='
+        ]
+    b = []
+    for name in sorted(skel2dix.parsers.keys()):
+        parserClass = skel2dix.parsers[name]
+        b.append(('parse-' + name, lambda c=parserClass: benchParse(c, dataLines)))
+    for tpe in ['s', 'd', 'bi']:
+        targets = [skel2dix.Target(tpe, False)]
+        b.append(('process-' + tpe, lambda t=targets: benchTargets(inPath, outDir, t)))
+    targets = [skel2dix.Target(tpe, False) for tpe in ['s', 'd', 'bi']]
+    b.append(('process-a', lambda: benchTargets(inPath, outDir, targets)))
+    targets = [skel2dix.Target('a', True)]
+    b.append(('processLemmas', lambda: benchTargets(inPath, outDir, targets)))
+    b.append(('hold-list', lambda: benchHold(
+        inPath,
+        lambda f, context: list(skel2dix.iterEntries(f, context=context))
+        )))
+    b.append(('hold-store', lambda: benchHold(
+        inPath,
+        lambda f, context: skel2dix.collectEntries(f, context=context)
+        )))
+    return b
+
+
+def run(benchmarks, lineCount, repeat, memory):
+    """
+    @return a list of result dicts
+    """
+    results = []
+    for name, fn in benchmarks:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            t = time.perf_counter() - start
+            best = t if best is None else min(best, t)
+        peak = None
+        if memory:
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results.append({
+            'name': name,
+            'seconds': best,
+            'lines': lineCount,
+            'linesPerSec': lineCount / best if best else None,
+            'peakMemoryBytes': peak
+        })
+        print('{0:16s} {1:8.3f}s {2:12.0f} lines/s {3}'.format(
+            name,
+            best,
+            lineCount / best if best else 0,
+            '' if peak is None else '{0:.1f}MB peak'.format(peak / 1048576.0)
+            ))
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Time skel2dix on a generated skeleton corpus"
+        )
+
+    parser.add_argument("-n", "--lines",
+        type=int,
+        default=100000,
+        help="lines of generated corpus (default: 100000)"
+        )
+
+    parser.add_argument("--stanzaMix",
+        default=defaultStanzaMix,
+        help="stanza names and weights, names from skel2dix.stanzas (default: '{0}')".format(defaultStanzaMix)
+        )
+
+    parser.add_argument("--setRate",
+        type=float,
+        default=0.4,
+        help="chance a line has a set (default: 0.4)"
+        )
+
+    parser.add_argument("--setSize",
+        default='2,5',
+        help="min,max marks in a set (default: '2,5')"
+        )
+
+    parser.add_argument("--multiWordRate",
+        type=float,
+        default=0.1,
+        help="chance a mark is multi-word (default: 0.1)"
+        )
+
+    parser.add_argument("--slashRate",
+        type=float,
+        default=0.1,
+        help="chance a paradigm is slashed, like 'bab/y' (default: 0.1)"
+        )
+
+    parser.add_argument("--commentRate",
+        type=float,
+        default=0.05,
+        help="chance of comment lines, and of comments after data (default: 0.05)"
+        )
+
+    parser.add_argument("--vocabulary",
+        type=int,
+        default=50000,
+        help="distinct words in the corpus (default: 50000)"
+        )
+
+    parser.add_argument("--seed",
+        type=int,
+        default=1,
+        help="random seed, so corpora can be regenerated (default: 1)"
+        )
+
+    parser.add_argument("-r", "--repeat",
+        type=int,
+        default=3,
+        help="runs of each benchmark. The best is reported (default: 3)"
+        )
+
+    parser.add_argument("--noMemory",
+        default=False,
+        help="skip the peak memory runs",
+        action="store_true"
+        )
+
+    parser.add_argument("--corpus",
+        default=None,
+        help="write the generated corpus to this path, then exit"
+        )
+
+    parser.add_argument("-o", "--output",
+        default=None,
+        help="write results to this JSON file"
+        )
+
+    args = parser.parse_args(argv)
+
+    try:
+        stanzaMix = parseStanzaMix(args.stanzaMix)
+    except ValueError as e:
+        skel2dix.printError(str(e))
+        return 1
+    setSize = tuple(int(x) for x in args.setSize.split(','))
+    corpusOptions = {
+        'lineCount': args.lines,
+        'stanzaMix': stanzaMix,
+        'setRate': args.setRate,
+        'setSize': setSize,
+        'multiWordRate': args.multiWordRate,
+        'slashRate': args.slashRate,
+        'commentRate': args.commentRate,
+        'vocabularySize': args.vocabulary,
+        'seed': args.seed
+    }
+
+    if args.corpus:
+        with open(args.corpus, 'w') as fOut:
+            generateCorpus(fOut, **corpusOptions)
+        return 0
+
+    workDir = tempfile.mkdtemp(prefix='skel2dix-bench-')
+    try:
+        inPath = os.path.join(workDir, 'corpus')
+        with open(inPath, 'w') as fOut:
+            generateCorpus(fOut, **corpusOptions)
+        results = run(
+            mkBenchmarks(inPath, workDir),
+            args.lines,
+            args.repeat,
+            not args.noMemory
+            )
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    if args.output:
+        report = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': dict(corpusOptions, stanzaMix=args.stanzaMix),
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -192,7 +192,28 @@ generates::
 import sys, getopt, re
 import os.path
 import argparse
-from collections import namedtuple
+import contextlib
+import io
+import time
+import json
+import zlib
+import gzip
+import bz2
+import lzma
+import locale
+import queue
+import hashlib
+import threading
+import filecmp
+import sqlite3
+import tempfile
+import shutil
+import heapq
+from xml.parsers import expat
+from collections import namedtuple, deque
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, groupby, islice
 
 
 dictionaryNames = {
@@ -201,8 +222,66 @@ dictionaryNames = {
     'bi': 'bi-lingual dictionary'
 }
 
-lineNum = 0
+# bytes. Output is written to disk in blocks of this size
+outputBufferSize = 1024 * 1024
 
+# for --pipeline. Lines are passed from the reader in batches of
+# this many, rendered text to writers in batches of this many 
+# characters. Queues hold this many batches, by default
+pipelineBatchLines = 1024
+pipelineBatchSize = 64 * 1024
+pipelineDepth = 8
+
+# as an input path, stdin. As an output path, stdout
+streamPath = '-'
+
+# text stream written for the output path '-', or None for 
+# sys.stdout. Set by main() for --stdout, as messages are then 
+# printed to stderr
+outputStream = None
+
+# file extension: module, for compressed inputs and outputs
+compressors = {
+    '.gz': gzip,
+    '.bz2': bz2,
+    '.xz': lzma
+}
+
+# Diagnostics held before writing, in a run from the commandline.
+# Not with input from stdin, where messages are written as found
+diagnosticsBatchSize = 1000
+
+# bytes. With --checkpoint, progress is saved after each part of 
+# input of this size
+checkpointSize = 64 * 1024 * 1024
+
+# change if the checkpoint format changes
+checkpointVersion = 1
+
+# bytes. With --sort, default memory for lines held before a sorted
+# run is written to a temporary file
+sortMemory = 256 * 1024 * 1024
+
+# with --sort, memory for a held line is estimated as twice its
+# length (the line and its key) and this many bytes of object
+# overhead
+sortLineOverhead = 200
+
+# with --sort, when an output has this many runs on disk, they are
+# merged into one, so a merge never opens more files than this
+sortMergeFanIn = 64
+
+# bytes. Default size limit of a build cache
+cacheSize = 512 * 1024 * 1024
+
+# average lines in a cached block, if stanzas are longer
+cacheBlockLines = 1024
+
+# change if the compiled format changes
+compiledVersion = 4
+
+# added to source paths, for compiled files
+compiledExtension = '.skc'
 
 Stanza = namedtuple('Stanza', [
     'baseParadigm'
@@ -281,14 +360,47 @@ ParsedData = namedtuple('ParsedData', [
     'defaultParadigms'
 ])
 
-def parseWarning(message):
-    global lineNum
-    print('{0:2d}:[warning] {1}'.format(lineNum, message))
-    
-def parseError(message):
-    global lineNum
-    print('{0:2d}:[error] {1}'.format(lineNum, message))
-    
+# A parsed line, from iterEntries().
+# 'src' and 'dst' are lists of MarkParadigmPair, with default 
+# paradigms applied. 'stanza' is a Stanza, 'stanzaName' its key.
+Entry = namedtuple('Entry', [
+    'stanzaName',
+    'stanza',
+    'src',
+    'dst',
+    'lineNum'
+])
+
+# A recognised stanza header line, from iterEntries().
+StanzaHeader = namedtuple('StanzaHeader', [
+    'name',
+    'stanza',
+    'lineNum'
+])
+
+# Parsed entries of a source file, from compileFile() or 
+# loadCompiled(). 'store' is an EntryStore. 'notes' are the stanza
+# headers, as [entry index, lineNum, stanzaName], and the parse 
+# diagnostics, as [entry index, lineNum, severity, code, message],
+# in order. The entry index is the count of entries before. 
+# 'counts' are the line counts of a Stats, or None.
+Compiled = namedtuple('Compiled', [
+    'size',
+    'mtime',
+    'sha256',
+    'stanzaKey',
+    'store',
+    'notes',
+    'counts'
+])
+
+# An output of a run.
+# 'lemmas' outputs the lemma list for the dictionaryType, not a dictionary.
+Target = namedtuple('Target', [
+    'dictionaryType',
+    'lemmas'
+])
+
 def printWarning(message):
     print('[warning] {0}'.format(message))
     
@@ -308,222 +420,470 @@ def prefix(line, limitStr):
     else: return line[:idx]
 
 
-def lemmaStem(entryData):
+def paradigmCut(paradigm):
     """
-    creates a lemma and stem matcher.
-    remove slash, on stem insert blank-tags.
+    Letters a slashed paradigm removes from the end of a stem, 
+    'bab/y' removes 1. 0 if the paradigm has no slash.
+    @param paradigm a stripped paradigm name
     """
-    p = entryData.paradigm.strip()
-    markStripped = entryData.mark.strip()
-    stemWithBlanks = markStripped.replace(" ", "<b/>")
-    idx = p.find('/')
-    if idx == -1:
-        return markStripped, stemWithBlanks
-    else:
-        try:
-            stemSliceIdx = len(stemWithBlanks) - (len(p) - idx - 1)
-        except:
-            return None
-        return markStripped, stemWithBlanks[:stemSliceIdx]
+    idx = paradigm.find('/')
+    return 0 if idx == -1 else len(paradigm) - idx - 1
 
 
-def matcher(lemmaMark):
-    """
-    creates a string matcher.
-    remove slash, insert blank-tags.
-    used for late matches in bi-lingual dictionaries.
-    """
-    return lemmaMark.strip().replace(" ", "<b/>")
-    
-def lemmaMatcher(lemmaMark):
-    l = lemmaMark.strip()
-    return l, l.replace(" ", "<b/>")
-    
 def mkParadigm(paradigmPrefix, baseParadigm):
     return baseParadigm if not paradigmPrefix else paradigmPrefix.strip() + '__' + baseParadigm
                                 
-def monodixTemplate(fOut, pairs, baseParadigm):
+def monodixTemplate(pairs, baseParadigm):
+    """
+    @return a list of entries, one string each
+    """
     # <e lm="tatty"><i>tatt</i><par n="bab/y__n"/></e>
-    for pair in pairs:
-        ls = lemmaStem(pair)
-        if not ls:
-            printError("building lemma and stem mark:{0} paradigm:{1}".format(pair.mark, pair.paradigm))
+    # The lemma, the stem (blank-tags for spaces, cut by a slashed
+    # paradigm) and mkParadigm(), inline. The work for each mark is
+    # less than a call, or a lookup in a cache. The bilingual 
+    # templates inline their matchers the same way
+    b = []
+    for mark, paradigmPrefix in pairs:
+        lemma = mark.strip()
+        stem = lemma.replace(" ", "<b/>")
+        if not paradigmPrefix:
+            paradigm = baseParadigm
         else:
-            lemma, stem = ls
-            paradigm = mkParadigm(pair.paradigm, baseParadigm)
-            fOut.write('<e lm="')
-            fOut.write(lemma)
-            fOut.write('"><i>')
-            fOut.write(stem)
-            fOut.write('</i><par n="')
-            fOut.write(paradigm)
-            fOut.write('"/></e>\n')
-
-def bilingualTemplate(fOut, srcPair, dstPair, baseParadigm):
+            p = paradigmPrefix.strip()
+            if '/' in p:
+                stem = stem[:len(stem) - paradigmCut(p)]
+            paradigm = p + '__' + baseParadigm
+        b.append(f'<e lm="{lemma}"><i>{stem}</i><par n="{paradigm}"/></e>\n')
+    return b
+
+def bilingualEntry(srcM, dstM, baseParadigm, direction=''):
+    """
+    @param direction attribute text e.g. ' r="LR"', or empty
+    @return an entry string
+    """
+    # <e><p><l>snack<s n="n"/></l><r>baggin<s n="n"/></r></p></e>
+    return (f'<e{direction}><p><l>{srcM}<s n="{baseParadigm}"/></l>'
+        f'<r>{dstM}<s n="{baseParadigm}"/></r></p></e>\n')
+
+def bilingualTemplate(srcPair, dstPair, baseParadigm):
+    """
+    @return a list of entries, one string each
+    """
     # <e><p><l>snack<s n="n"/></l><r>baggin<s n="n"/></r></p></e>
-    srcM = matcher(srcPair.mark)
-    dstM = matcher(dstPair.mark)
-
-    fOut.write('<e><p><l>')
-    fOut.write(srcM)
-    fOut.write('<s n="')
-    fOut.write(baseParadigm)
-    fOut.write('"/></l><r>')
-    fOut.write(dstM)
-    fOut.write('<s n="')
-    fOut.write(baseParadigm)
-    fOut.write('"/></r></p></e>\n')
+    srcM = srcPair.mark.strip().replace(" ", "<b/>")
+    dstM = dstPair.mark.strip().replace(" ", "<b/>")
+    return [bilingualEntry(srcM, dstM, baseParadigm)]
     
 def bilingualTemplateWithTranslationMarkRL(
-    fOut,
      srcPairs,
      dstPair,
      baseParadigm
     ):
+    """
+    @return a list of entries, one string each
+    """
     # <e srl="snack D"><p><l>snack<s n="n"/></l><r>baggin<s n="n"/></r></p></e>
-    first = True
-    dstM = matcher(dstPair.mark)
+    # First is the default, others are marked left-to-right only
+    dstM = dstPair.mark.strip().replace(" ", "<b/>")
+    b = []
+    direction = ''
     for srcPair in srcPairs:
-        srcL, srcM = lemmaMatcher(srcPair.mark)
-        #fOut.write('<e srl="')
-        fOut.write('<e')
-        if first: 
-            first = False
-        else:
-            fOut.write(' r="LR"')
-
-        #fOut.write(srcL)
-        #if first: 
-            #fOut.write(' D')
-            #first = False
-        fOut.write('><p><l>')
-        fOut.write(srcM)
-        fOut.write('<s n="')
-        fOut.write(baseParadigm)
-        fOut.write('"/></l><r>')
-        fOut.write(dstM)
-        fOut.write('<s n="')
-        fOut.write(baseParadigm)
-        fOut.write('"/></r></p></e>\n')
+        srcM = srcPair.mark.strip().replace(" ", "<b/>")
+        b.append(bilingualEntry(srcM, dstM, baseParadigm, direction))
+        direction = ' r="LR"'
+    return b
     
 def bilingualTemplateWithTranslationMarkLR(
-    fOut,
      srcPair,
      dstPairs,
      baseParadigm
     ):
+    """
+    @return a list of entries, one string each
+    """
     # <e slr="baggin D"><p><l>snack<s n="n"/></l><r>baggin<s n="n"/></r></p></e>
-    first = True
-    srcM = matcher(srcPair.mark)
+    # First is the default, others are marked right-to-left only
+    srcM = srcPair.mark.strip().replace(" ", "<b/>")
+    b = []
+    direction = ''
     for dstPair in dstPairs:
-        dstL, dstM = lemmaMatcher(dstPair.mark)
-        #fOut.write('<e slr="')
-        fOut.write('<e')
-        if first: 
-            first = False
-        else: 
-            fOut.write(' r="RL"')
-        
-        #fOut.write(dstL)
-        #if first: 
-            #fOut.write(' D')
-            #first = False
-        fOut.write('><p><l>')
-        fOut.write(srcM)
-        fOut.write('<s n="')
-        fOut.write(baseParadigm)
-        fOut.write('"/></l><r>')
-        fOut.write(dstM)
-        fOut.write('<s n="')
-        fOut.write(baseParadigm)
-        fOut.write('"/></r></p></e>\n')
-
-
-def lemmaPrintTemplate(fOut, entryDatas):
-    for entryData in entryDatas:
-        lemma = entryData.mark.strip()
-        fOut.write(lemma)
-        fOut.write('\n')
+        dstM = dstPair.mark.strip().replace(" ", "<b/>")
+        b.append(bilingualEntry(srcM, dstM, baseParadigm, direction))
+        direction = ' r="RL"'
+    return b
+
+
+def lemmaPrintTemplate(entryDatas):
+    """
+    @return a list of lemma lines
+    """
+    return [entryData.mark.strip() + '\n' for entryData in entryDatas]
         
         
 def stanzaAnnotateTemplate(fOut, stanzaName, inPath):
-    fOut.write('\n<!-- ')
-    fOut.write(stanzaName)
-    fOut.write(' -->\n')
-    
     # initial tests guarantee a basename exists 
     fName = os.path.basename(inPath)
-    fOut.write('<!-- ')
-    fOut.write(fName)
-    fOut.write(' -->\n')
+    fOut.write('\n<!-- ' + stanzaName + ' -->\n<!-- ' + fName + ' -->\n')
 
 
 
 
 ########################
-def processLine(fOut, targetDictionary, stanza, parseResult):
+def lineEntries(targetDictionary, stanza, parseResult):
     """
-    Processes line data by writing to the appropriate template.
+    Renders line data with the appropriate template.
     Assumes all input is correctly formed e.g. that one of srcLemma and dstLemma 
     is a list of length = 1.
-    @param srcLemma a list
-    @param dstLemma a list
-    @param paradigms must be two elems, though the elems can be empty. 
-    Must be pre-stripped.
+    @param parseResult has 'src' and 'dst' lists of MarkParadigmPair. 
+    Paradigms must be pre-stripped.
+    @return a list of entries, one string each
     """
     baseParadigm = stanza.baseParadigm
 
     # which target?
     if targetDictionary == 's':
-        monodixTemplate(
-                        fOut, 
-                        parseResult.src, 
-                        baseParadigm
-                        )
+        return monodixTemplate(parseResult.src, baseParadigm)
     elif targetDictionary == 'd':
-        monodixTemplate(
-                        fOut, 
-                        parseResult.dst, 
-                        baseParadigm
-                        )
+        return monodixTemplate(parseResult.dst, baseParadigm)
     elif targetDictionary == 'bi':
         if(len(parseResult.src) > 1):
-            bilingualTemplateWithTranslationMarkRL(
-            fOut,
+            return bilingualTemplateWithTranslationMarkRL(
             parseResult.src, 
             parseResult.dst[0], 
             baseParadigm
             )
         elif (len(parseResult.dst) > 1):
-            bilingualTemplateWithTranslationMarkLR(
-            fOut,
+            return bilingualTemplateWithTranslationMarkLR(
             parseResult.src[0], 
             parseResult.dst, 
             baseParadigm
             )
         else:
             # no alternative translations. Easy...
-            bilingualTemplate(
-            fOut, 
+            return bilingualTemplate(
             parseResult.src[0], 
             parseResult.dst[0],  
             baseParadigm
             )    
+    return []
   
 
+def processLine(fOut, targetDictionary, stanza, parseResult):
+    """
+    Processes line data by writing to the appropriate template.
+    """
+    fOut.write(''.join(lineEntries(targetDictionary, stanza, parseResult)))
+
         
-def processLineForLemma(fOut, dictionaryType, parseResult):
-    # <e lm="tatty"><i>tatt</i><par n="bab/y__n"/></e>
+def lineLemmas(dictionaryType, parseResult):
+    """
+    @return a list of lemma lines
+    """
     if dictionaryType == 's':
-        lemmaPrintTemplate(fOut, parseResult.src)
+        return lemmaPrintTemplate(parseResult.src)
     elif dictionaryType == 'd':
-        lemmaPrintTemplate(fOut, parseResult.dst)
+        return lemmaPrintTemplate(parseResult.dst)
     else:
         # bi and a do the same thing, print all lemmas
-        lemmaPrintTemplate(fOut, parseResult.src)
-        lemmaPrintTemplate(fOut, parseResult.dst)
+        return lemmaPrintTemplate(parseResult.src) + lemmaPrintTemplate(parseResult.dst)
+
+        
+def processLineForLemma(fOut, dictionaryType, parseResult):
+    fOut.write(''.join(lineLemmas(dictionaryType, parseResult)))
+
+            
+# A message about the input.
+# 'lineNum' is None for messages not about one line. 'code' is
+# a short name for the kind of message, e.g. 'set-not-closed'. 
+Diagnostic = namedtuple('Diagnostic', [
+    'path',
+    'lineNum',
+    'severity',
+    'code',
+    'message'
+])
+
+
+def diagnosticText(d):
+    if d.lineNum is None:
+        return '[{0}] {1}\n'.format(d.severity, d.message)
+    return '{0:2d}:[{1}] {2}\n'.format(d.lineNum, d.severity, d.message)
+    
+    
+class Diagnostics():
+    """
+    Collects Diagnostics, and writes them in batches.
+    Text goes to a stream, and every Diagnostic can go to a JSON 
+    lines file. Text can be capped for each code, with a count
+    of the rest at close().
+    """
+    def __init__(
+        self,
+        textOut=None,
+        jsonOut=None,
+        quiet=False,
+        maxPerCode=None,
+        batchSize=1
+        ):
+        """
+        @param textOut stream for text, with a write() method. 
+        Defaults to sys.stdout, as found when writing.
+        @param jsonOut stream for JSON lines, or None
+        @param quiet if True, no text
+        @param maxPerCode text for only this many of each code, or None
+        @param batchSize Diagnostics held before writing. The 
+        default writes each at once
+        """
+        self.textOut = textOut
+        self.jsonOut = jsonOut
+        self.quiet = quiet
+        self.maxPerCode = maxPerCode
+        self.batchSize = batchSize
+        self.pending = []
+        # {code: count}
+        self.counts = {}
+        # {severity: count}
+        self.severities = {}
+        
+    def add(self, d):
+        self.pending.append(d)
+        if len(self.pending) >= self.batchSize:
+            self.flush()
+            
+    def extend(self, ds):
+        for d in ds:
+            self.add(d)
+        
+    def flush(self):
+        if not self.pending:
+            return
+        text = []
+        counts = self.counts
+        severities = self.severities
+        maxPerCode = self.maxPerCode
+        quiet = self.quiet
+        for d in self.pending:
+            severities[d.severity] = severities.get(d.severity, 0) + 1
+            count = counts.get(d.code, 0) + 1
+            counts[d.code] = count
+            if not quiet and (maxPerCode is None or count <= maxPerCode):
+                text.append(diagnosticText(d))
+        if text:
+            (self.textOut or sys.stdout).write(''.join(text))
+        if self.jsonOut is not None:
+            self.jsonOut.write(''.join(
+                json.dumps(d._asdict()) + '\n' for d in self.pending
+            ))
+        self.pending = []
+        
+    def close(self):
+        """
+        Flush, and write counts of capped text.
+        """
+        self.flush()
+        if self.quiet or self.maxPerCode is None:
+            return
+        text = []
+        for code in sorted(self.counts):
+            count = self.counts[code]
+            if count > self.maxPerCode:
+                text.append('[summary] {0} more \'{1}\' not shown ({2} in total)\n'.format(
+                    count - self.maxPerCode, code, count
+                    ))
+        (self.textOut or sys.stdout).write(''.join(text))
+
+
+class _DiagnosticList(list):
+    # Diagnostics sink which only gathers, e.g. in worker processes
+    add = list.append
+    
+    def flush(self):
+        pass
+
+        
+class Context():
+    """
+    State for one conversion.
+    Carries the line counter, the sink for messages, the stanza map
+    and the output handles. Conversions with their own Context can 
+    run at the same time, e.g. on threads.
+    """
+    def __init__(
+        self,
+        inPath='',
+        outs=None,
+        stanzaMap=None,
+        log=None,
+        stats=None,
+        diagnostics=None,
+        pardefs=None,
+        check=False
+        ):
+        """
+        @param inPath source path, for annotation
+        @param outs list of (Target, fOut). fOut needs only a write() method.
+        @param stanzaMap defaults to `stanzas`
+        @param log stream for message text, if no diagnostics are 
+        given. Defaults to sys.stdout, as found when writing.
+        @param stats a Stats to count into, or None
+        @param diagnostics a Diagnostics, or other object with add() 
+        and flush(). If None, a Diagnostics writing to log.
+        @param pardefs a set of paradigm names. If given, monodix
+        entries using other paradigms are reported.
+        @param check if True, entries are checked by checkEntry()
+        """
+        self.lineNum = 0
+        self.inPath = inPath
+        self.outs = [] if outs is None else outs
+        self.stanzas = stanzas if stanzaMap is None else stanzaMap
+        self.stats = stats
+        self.diagnostics = Diagnostics(log) if diagnostics is None else diagnostics
+        self.pardefs = pardefs
+        self.check = check
+
+    def diagnostic(self, lineNum, severity, code, message):
+        self.diagnostics.add(Diagnostic(self.inPath, lineNum, severity, code, message))
+        
+    def parseWarning(self, message, code='parse'):
+        self.diagnostic(self.lineNum, 'warning', code, message)
+    
+    def parseError(self, message, code='parse'):
+        self.diagnostic(self.lineNum, 'error', code, message)
+
+    def printWarning(self, message, code='general'):
+        self.diagnostic(None, 'warning', code, message)
+
+    def printError(self, message, code='general'):
+        self.diagnostic(None, 'error', code, message)
+        
+    def flush(self):
+        self.diagnostics.flush()
+        
+
+class Stats():
+    """
+    Counters and stage timings for --stats.
+    One for each input file, which can be added for totals.
+    """
+    stages = ('read', 'parse', 'default', 'render')
+    counters = ('lines', 'blank', 'comments', 'unknownStanza', 'parseFails', 'cachedLines')
+    
+    def __init__(self, name=''):
+        self.name = name
+        # seconds spent in each stage
+        self.times = dict.fromkeys(self.stages, 0.0)
+        self.counts = dict.fromkeys(self.counters, 0)
+        # {target name: {stanza name: entry count}}
+        self.entries = {}
+        # {queue name: {'puts', 'depthTotal', 'maxDepth', 'putWait',
+        # 'getWait'}}, for --pipeline
+        self.queues = {}
+        # wall time
+        self.elapsed = 0.0
+
+    def countEntries(self, targetName, stanzaName, count):
+        byStanza = self.entries.setdefault(targetName, {})
+        byStanza[stanzaName] = byStanza.get(stanzaName, 0) + count
+        
+    def addCounts(self, other):
+        for k, v in other.counts.items():
+            self.counts[k] += v
+        for targetName, byStanza in other.entries.items():
+            for stanzaName, count in byStanza.items():
+                self.countEntries(targetName, stanzaName, count)
 
+    def countQueue(self, stageQueue):
+        self.addQueue(stageQueue.name, {
+            'puts': stageQueue.puts,
+            'depthTotal': stageQueue.depthTotal,
+            'maxDepth': stageQueue.maxDepth,
+            'putWait': stageQueue.putWait,
+            'getWait': stageQueue.getWait
+            })
             
+    def addQueue(self, name, counts):
+        q = self.queues.get(name)
+        if q is None:
+            self.queues[name] = dict(counts)
+        else:
+            for k, v in counts.items():
+                q[k] = max(q[k], v) if k == 'maxDepth' else q[k] + v
+
+    def add(self, other):
+        for k, v in other.times.items():
+            self.times[k] += v
+        self.addCounts(other)
+        for name, counts in other.queues.items():
+            self.addQueue(name, counts)
+        self.elapsed += other.elapsed
+        
+    def linesPerSec(self):
+        return self.counts['lines'] / self.elapsed if self.elapsed else 0.0
+        
+    def asDict(self):
+        return {
+            'name': self.name,
+            'times': self.times,
+            'counts': self.counts,
+            'entries': self.entries,
+            'queues': self.queues,
+            'elapsed': self.elapsed,
+            'linesPerSec': self.linesPerSec()
+        }
+        
+    def report(self, fOut):
+        c = self.counts
+        fOut.write('[stats] {0}\n'.format(self.name))
+        fOut.write('  lines: {0} (blank {1}, comments {2}, unknown stanza {3}, parse fails {4}, from cache {5})\n'.format(
+            c['lines'], c['blank'], c['comments'], c['unknownStanza'], c['parseFails'], c['cachedLines']
+            ))
+        fOut.write('  time: {0}, total {1:.3f}s ({2:.0f} lines/s)\n'.format(
+            ', '.join('{0} {1:.3f}s'.format(k, self.times[k]) for k in self.stages),
+            self.elapsed,
+            self.linesPerSec()
+            ))
+        for name, q in self.queues.items():
+            fOut.write('  queue {0}: depth mean {1:.1f} max {2}, put wait {3:.3f}s, get wait {4:.3f}s\n'.format(
+                name,
+                q['depthTotal'] / q['puts'] if q['puts'] else 0.0,
+                q['maxDepth'],
+                q['putWait'],
+                q['getWait']
+                ))
+        for targetName in sorted(self.entries):
+            byStanza = self.entries[targetName]
+            fOut.write('  entries {0}: {1} ({2})\n'.format(
+                targetName,
+                sum(byStanza.values()),
+                ', '.join('{0} {1}'.format(k, byStanza[k]) for k in sorted(byStanza))
+                ))
+
+
+def _timedLines(lines, times):
+    # yields lines, adding the time spent reading to times['read']
+    clock = time.perf_counter
+    it = iter(lines)
+    while True:
+        start = clock()
+        l = next(it, None)
+        times['read'] += clock() - start
+        if l is None:
+            return
+        yield l
+
+        
+def targetName(target):
+    return 'lemmas-' + target.dictionaryType if target.lemmas else target.dictionaryType
+    
+    
+def _fillDefault(pairs, defaultP):
+    # in place, on the pairs of a set as they leave a parser
+    if defaultP:
+        for i, pair in enumerate(pairs):
+            if not pair.paradigm:
+                pairs[i] = MarkParadigmPair(pair.mark, defaultP)
+
+
 # Anyone who likes Python because it is clean should stop long before
 # classes.
 #...and it should be a function, but Python scoping can't handle it
@@ -533,7 +893,11 @@ class Parser():
     """
     EOL = '\f'
 
-    def __init__(self):
+    def __init__(self, context=None):
+        """
+        @param context a Context, for messages
+        """
+        self.context = Context() if context is None else context
         self.b = [[],[]]
         self.defaultParadigms = ['', '']
         self.line = ''
@@ -566,7 +930,7 @@ class Parser():
         return
     
     def loadPair(self):
-        self.b[self.side].append(MarkParadigmPair(self.mark, self.paradigm))
+        self.b[self.side].append(MarkParadigmPair(self.mark, self.paradigm.strip()))
         self.mark = ''
         self.paradigm = ''
 
@@ -600,7 +964,7 @@ class Parser():
         if self.curr ==  ':':
             self.skip()
             self.findAny('.}{:#')
-            self.defaultParadigms[target] = self.line[self.prev:self.i]
+            self.defaultParadigms[target] = self.line[self.prev:self.i].strip()
         
     def parseSide(self, target):
         self.side = target
@@ -620,33 +984,34 @@ class Parser():
                     self.findAny('.}{:#')
                     self.parseDefaultParadigmOption(target)
                 else:
-                    parseError("set not closed?: '" + self.line + "'")
+                    self.context.parseError("set not closed?: '" + self.line + "'", 'set-not-closed')
                     # kill with fake EOL
                     self.curr = self.EOL
             else:
-                parseError("set open not followed by mark?: '" + self.line + "'")
+                self.context.parseError("set open not followed by mark?: '" + self.line + "'", 'set-open-no-mark')
                 # kill with fake EOL
                 self.curr = self.EOL
 
         elif self.curr ==  ':':
-            parseError("paradigm not preceeded by mark: '" + self.line + "'")
+            self.context.parseError("paradigm not preceeded by mark: '" + self.line + "'", 'paradigm-no-mark')
             # kill with fake EOL
             self.curr = self.EOL
         elif self.curr ==  '#':
             # kill with fake EOL
             self.curr = self.EOL
         elif self.curr ==  '}':
-            parseError("bracket not matched: '" + self.line + "'")
+            self.context.parseError("bracket not matched: '" + self.line + "'", 'bracket-not-matched')
             # kill with fake EOL
             self.curr = self.EOL
         elif self.curr == self.EOL:
-            parseError("data expected, but End Of Line: '" + self.line + "'")
+            self.context.parseError("data expected, but End Of Line: '" + self.line + "'", 'no-data')
 
 
     def parse(self, targetLine):
         """
         Parse a line.
-        Output is not stripped.
+        Marks are not stripped. Paradigms are stripped, and empty
+        paradigms in a set filled from its default.
         Reusable (oh, crimes, crimes).
         @return a list of two lists of MarkParadigmPairs. If the parse 
         fails, None, while emitting error messages.
@@ -666,268 +1031,3683 @@ class Parser():
         self.parseSide(0)
         if  self.curr == '.' or self.curr == '{':
             self.parseSide(1)
+            _fillDefault(self.b[0], self.defaultParadigms[0])
+            _fillDefault(self.b[1], self.defaultParadigms[1])
             return ParsedData(self.b[0], self.b[1], self.defaultParadigms)
         else:
-            parseWarning("Unable to find second element: '" + self.line + "'")
+            self.context.parseWarning("Unable to find second element: '" + self.line + "'", 'no-second-element')
             return None
             
-################
 
-def processLemmas(inPath, outPath, dictionaryType, annotate):
+
+# Splits a line to [text, delimiter, text, delimiter,... text]
+_splitTokens = re.compile(r'([.}{:#])').split
+
+# Matches a well-formed line, for FastParser. Each side is a pair
+# (mark, paradigm), or a set (pairs, defaultParadigm).
+_text = r'[^.}{:#]*'
+_pair = r'\.(' + _text + r')(?::(' + _text + r'))?'
+_side = (r'(?:' + _pair 
+    + r'|\{' + _text + r'((?:\.' + _text + r'(?::' + _text + r')?)+)\}' 
+    + _text + r'(?::(' + _text + r'))?)'
+    )
+_matchLine = re.compile(_text + _side + _side).match
+_findPairs = re.compile(_pair).findall
+
+# namedtuple construction without the Python-level __new__
+_newTuple = tuple.__new__
+
+def _setPairs(setText, defaultP=''):
     """
-    Process a file, stepping by line.
+    Pairs from the matched text of a well-formed set.
+    Paradigms are stripped, and empty paradigms are defaultP.
+    @param defaultP the stripped default paradigm of the set
+    @return a list of MarkParadigmPairs
     """
-    global lineNum
-    
-    print(outPath)
-    fIn = open(inPath, 'r')
-    fOut = open(outPath, 'a')
-    
-    stanza = unknownStanza
-    
-    p = Parser()
+    if ':' in setText:
+        pairs = [(m, p.strip() or defaultP) for m, p in _findPairs(setText)]
+    else:
+        pairs = zip(setText.split('.')[1:], repeat(defaultP))
+    return list(map(_newTuple, repeat(MarkParadigmPair), pairs))
 
-    lineNum = 0
-    
-    for l in fIn:
-        lineNum += 1
-        line = l.strip()
-        
-        if not line or line[0] == '#':
-            # skip empty lines and comments
-            pass
-        elif line[0] == '=':
-            # detect new stanza 
-            sStr = suffix(line, '=').strip().lower()
-            stanza = stanzas.get(sStr, unknownStanza)
-            if stanza == unknownStanza:
-                parseWarning("unknown stanza name: '" + sStr + "'")
+
+class FastParser():
+    """
+    Parses a line.
+    Same output and messages as Parser, but well-formed lines are
+    matched by one compiled regex. Other lines are tokenized by a
+    regex, then parsed from the tokens.
+    """
+    EOL = '\f'
+
+    def __init__(self, context=None):
+        """
+        @param context a Context, for messages
+        """
+        self.context = Context() if context is None else context
+
+    def parse(self, targetLine):
+        """
+        Parse a line.
+        Marks are not stripped. Paradigms are stripped, and empty
+        paradigms in a set filled from its default.
+        @return a list of two lists of MarkParadigmPairs. If the parse 
+        fails, None, while emitting error messages.
+        """
+        m = _matchLine(targetLine)
+        if m:
+            srcMark, srcParadigm, srcSet, srcDefault, dstMark, dstParadigm, dstSet, dstDefault = m.groups()
+            if srcSet is None:
+                src = [_newTuple(MarkParadigmPair, (srcMark, srcParadigm.strip() if srcParadigm else ''))]
+                srcDefault = ''
             else:
-                if annotate: stanzaAnnotateTemplate(fOut, sStr, inPath)
-        elif stanza == unknownStanza:
-            # not found a stanza, now
-            # skip line if unknownStanza
-            pass
-        else:
-            # process a line
-            r = p.parse(line)
-            if r == None:
-                printWarning('parse fail?')
+                srcDefault = srcDefault.strip() if srcDefault else ''
+                src = _setPairs(srcSet, srcDefault)
+            if dstSet is None:
+                dst = [_newTuple(MarkParadigmPair, (dstMark, dstParadigm.strip() if dstParadigm else ''))]
+                dstDefault = ''
             else:
-                # verify this
-                if len(r.src)> 1 and len(r.dst) > 1:
-                    parseError("source and destination are both sets: '" + line + "'")
+                dstDefault = dstDefault.strip() if dstDefault else ''
+                dst = _setPairs(dstSet, dstDefault)
+            return _newTuple(ParsedData, (src, dst, [srcDefault, dstDefault]))
+
+        # Not well-formed. Walk the tokens, for the messages
+        context = self.context
+        EOL = self.EOL
+        tokens = _splitTokens(targetLine)
+        end = len(tokens)
+        b = [[], []]
+        defaultParadigms = ['', '']
+        
+        # tokens[i] is the current delimiter, tokens[i + 1] the text 
+        # following. Text before the first delimiter is ignored.
+        i = 1
+        for side in (0, 1):
+            pairs = b[side]
+            curr = tokens[i] if i < end else EOL
+            if curr == '.':
+                mark = tokens[i + 1]
+                i += 2
+                curr = tokens[i] if i < end else EOL
+                paradigm = ''
+                if curr == ':':
+                    paradigm = tokens[i + 1].strip()
+                    i += 2
+                    curr = tokens[i] if i < end else EOL
+                pairs.append(MarkParadigmPair(mark, paradigm))
+            elif curr == '{':
+                i += 2
+                curr = tokens[i] if i < end else EOL
+                if curr == '.':
+                    while curr == '.':
+                        mark = tokens[i + 1]
+                        i += 2
+                        curr = tokens[i] if i < end else EOL
+                        paradigm = ''
+                        if curr == ':':
+                            paradigm = tokens[i + 1].strip()
+                            i += 2
+                            curr = tokens[i] if i < end else EOL
+                        pairs.append(MarkParadigmPair(mark, paradigm))
+                    if curr == '}':
+                        i += 2
+                        curr = tokens[i] if i < end else EOL
+                        if curr == ':':
+                            defaultParadigms[side] = tokens[i + 1].strip()
+                            i += 2
+                            curr = tokens[i] if i < end else EOL
+                    else:
+                        context.parseError("set not closed?: '" + targetLine + "'", 'set-not-closed')
+                        curr = EOL
                 else:
-                    # gather entryData, no paradigm needed
-                    srcNew = [MarkParadigmPair(e.mark, '') for e in r.src]
-                    dstNew = [MarkParadigmPair(e.mark, '') for e in r.dst]
-                    # defaults now processed, abandon
-                    newR = ParsedData(srcNew, dstNew, [])
-                    # no stanza?
-                    processLineForLemma(fOut, dictionaryType, newR)
+                    context.parseError("set open not followed by mark?: '" + targetLine + "'", 'set-open-no-mark')
+                    curr = EOL
+            elif curr == ':':
+                context.parseError("paradigm not preceeded by mark: '" + targetLine + "'", 'paradigm-no-mark')
+                curr = EOL
+            elif curr == '#':
+                curr = EOL
+            elif curr == '}':
+                context.parseError("bracket not matched: '" + targetLine + "'", 'bracket-not-matched')
+                curr = EOL
+            else:
+                context.parseError("data expected, but End Of Line: '" + targetLine + "'", 'no-data')
+
+            if side == 0 and curr != '.' and curr != '{':
+                context.parseWarning("Unable to find second element: '" + targetLine + "'", 'no-second-element')
+                return None
+        _fillDefault(b[0], defaultParadigms[0])
+        _fillDefault(b[1], defaultParadigms[1])
+        return ParsedData(b[0], b[1], defaultParadigms)
 
-    fIn.close()
-    fOut.close()
 
+parsers = {
+    'classic': Parser,
+    'fast': FastParser
+}
 
+################
 
-def process(inPath, outPath, dictionaryType, annotate):
+def assertParadigm(pairs, defaultP):
     """
-    Process a file, stepping by line.
+    Fill empty paradigms from the default, and strip paradigms.
+    Both parsers already do this as they build the pairs, so for
+    their output the list given is returned, not a copy. Kept for
+    other sources of ParsedData.
+    @return a list of MarkParadigmPairs. If no pair changes, the 
+    list given, not a copy.
     """
-    global lineNum
-    
-    fIn = open(inPath, 'r')
-    fOut = open(outPath, 'a')
+    for i, pair in enumerate(pairs):
+        p = pair.paradigm
+        if p:
+            if p[0].isspace() or p[-1].isspace():
+                break
+        elif defaultP:
+            break
+    else:
+        return pairs
+    b = pairs[:i]
+    for pair in pairs[i:]:
+        p = pair.paradigm.strip()
+        newP = defaultP if not p else p
+        b.append(MarkParadigmPair(pair.mark, newP))
+    return b
+
+
+def iterEntries(
+    lines,
+    parserClass=Parser,
+    startLineNum=0,
+    startStanzaName=None,
+    headers=False,
+    context=None
+    ):
+    """
+    Parse lines, lazily.
+    Lines in unknown stanzas, comments, and lines that fail to parse 
+    are skipped, with messages.
+    @param lines any iterable of lines, e.g. a file or sys.stdin
+    @param parserClass one of the values in `parsers`
+    @param startLineNum number of the line before the first line
+    @param startStanzaName stanza name in force at the first line, 
+    or None. Not warned or yielded as a header.
+    @param headers if True, also yield a StanzaHeader for each 
+    recognised stanza header
+    @param context a Context, for the stanza map, line count and 
+    messages. If None, a new Context.
+    @return a generator of Entry (and StanzaHeader)
+    """
+    if context is None:
+        context = Context()
+    stanzaMap = context.stanzas
+    stats = context.stats
+    if stats is not None:
+        times = stats.times
+        counts = stats.counts
+        clock = time.perf_counter
+        lines = _timedLines(lines, times)
     
-    stanza = unknownStanza
+    stanzaName = startStanzaName
+    stanza = stanzaMap.get(startStanzaName, unknownStanza)
     
-    p = Parser()
+    p = parserClass(context)
 
-    lineNum = 0
+    lineNum = startLineNum
     
-    for l in fIn:
-        lineNum += 1
-        line = l.strip()
+    try:
+        for l in lines:
+            lineNum += 1
+            context.lineNum = lineNum
+            line = l.strip()
         
-        if not line or line[0] == '#':
-            # skip empty lines and comments
-            pass
-        elif line[0] == '=':
-            # detect new stanza 
-            sStr = suffix(line, '=').strip().lower()
-            stanza = stanzas.get(sStr, unknownStanza)
-            if stanza == unknownStanza:
-                parseWarning("unknown stanza name: '" + sStr + "'")
-            else:
-                if annotate: stanzaAnnotateTemplate(fOut, sStr, inPath)
-        elif stanza == unknownStanza:
-            # not found a stanza, now
-            # skip line if unknownStanza
-            pass
-        else:
-            # process a line
-            r = p.parse(line)
-            if r == None:
-                printWarning('parse fail?')
+            if not line or line[0] == '#':
+                # skip empty lines and comments
+                if stats is not None:
+                    counts['comments' if line else 'blank'] += 1
+            elif line[0] == '=':
+                # detect new stanza. Interned, as held by every entry
+                stanzaName = sys.intern(suffix(line, '=').strip().lower())
+                stanza = stanzaMap.get(stanzaName, unknownStanza)
+                if stanza == unknownStanza:
+                    context.parseWarning("unknown stanza name: '" + stanzaName + "'", 'unknown-stanza')
+                elif headers:
+                    yield StanzaHeader(stanzaName, stanza, lineNum)
+            elif stanza == unknownStanza:
+                # not found a stanza, now
+                # skip line if unknownStanza
+                if stats is not None:
+                    counts['unknownStanza'] += 1
             else:
-                #print("parse:")
-                #print(r.src)
-                #print(r.dst) 
-               # print(r.defaultParadigms)
-                #print("--")
-
-                # verify this
-                if len(r.src)> 1 and len(r.dst) > 1:
-                    parseError("source and destination are both sets: '" + line + "'")
+                # process a line
+                if stats is None:
+                    r = p.parse(line)
                 else:
-                    # assert paradigms, fill empty from default
-                    # TODO: This is placed wastefully early,
-                    # as bi- template does not uses paradigm prefixs
-                    def assertParadigm(pairs, defaultP):
-                        b = []
-                        for pair in pairs:
-                            p = pair.paradigm.strip()
-                            newP = defaultP if not p else p
-                            b.append(MarkParadigmPair(pair.mark, newP))
-                        return b
-                    srcNew = assertParadigm(r.src, r.defaultParadigms[0])
-                    dstNew = assertParadigm(r.dst, r.defaultParadigms[1])
-
-                    # defaults now processed, abandon
-                    newR = ParsedData(srcNew, dstNew, [])
-                    processLine(fOut, dictionaryType, stanza, newR)
-
-    fIn.close()
-    fOut.close()
-    
-def _silentRemove(entryPath):
-    try:
-        os.remove(entryPath)
-    except OSError:
-        pass
+                    start = clock()
+                    r = p.parse(line)
+                    times['parse'] += clock() - start
+                if r == None:
+                    context.printWarning('parse fail?', 'parse-fail')
+                    if stats is not None:
+                        counts['parseFails'] += 1
+                else:
+                    # verify this
+                    if len(r.src)> 1 and len(r.dst) > 1:
+                        context.parseError("source and destination are both sets: '" + line + "'", 'both-sets')
+                        if stats is not None:
+                            counts['parseFails'] += 1
+                    else:
+                        # assert paradigms, fill empty from default
+                        # TODO: This is placed wastefully early,
+                        # as bi- template does not uses paradigm prefixs
+                        if stats is None:
+                            srcNew = assertParadigm(r.src, r.defaultParadigms[0])
+                            dstNew = assertParadigm(r.dst, r.defaultParadigms[1])
+                        else:
+                            start = clock()
+                            srcNew = assertParadigm(r.src, r.defaultParadigms[0])
+                            dstNew = assertParadigm(r.dst, r.defaultParadigms[1])
+                            times['default'] += clock() - start
+                        yield Entry(stanzaName, stanza, srcNew, dstNew, lineNum)
     
-def outputEntryPath(outputBasenamePath, basename, tpe):
-    return os.path.join(outputBasenamePath, basename + '-' + tpe + '.parDix')
-
-def processOpts(opts):
-    if (opts.lemmaFile):
-        o = os.path.join(opts.outputBasenamePath,  opts.outputBasename + '-lemmas')
-        # delete existing output file
-        _silentRemove(o) 
-        for inPath in opts.infiles:
-            processLemmas(inPath, o, opts.type, opts.annotate)
+        if stats is not None:
+            counts['lines'] += lineNum - startLineNum
+    finally:
+        # also if the consumer stops early
+        context.flush()
 
-    else:
-        if(opts.type == 'a'):
-            oS = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, 's')
-            oD = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, 'd')
-            oBi = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, 'bi')
-            # delete existing output files
-            _silentRemove(oS) 
-            _silentRemove(oD) 
-            _silentRemove(oBi) 
-    
-            for inPath in opts.infiles:
-                process(inPath, oS, 's', opts.annotate)
-                process(inPath, oD, 'd', opts.annotate)
-                process(inPath, oBi, 'bi', opts.annotate)
-                
-        else:
-            oPath = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, opts.type)
-            # trunc the output files
-            _silentRemove(oPath) 
-    
-            for inPath in opts.infiles:
-                process(inPath, oPath, opts.type, opts.annotate)
 
-        
-def stripExtension(path):
-    #os.path.basename(path)
-    i = path.rfind('.')
-    return path[:i] if (i != -1) else path
-    
+class EntryStore():
+    """
+    Compact store of Entry records, for holding a whole corpus.
+    Marks, paradigms and stanzas are kept once each, in tables. 
+    Entries are arrays of table ids, so cost a few bytes each. 
+    Entries are made again as Entry records when read.
+    """
+    # array columns, in the order tofile() writes them
+    columns = (
+        'entryStanzas',
+        'lineNums',
+        'pairStarts',
+        'srcCounts',
+        'marks',
+        'paradigms'
+        )
 
-# main
+    def __init__(self, entries=()):
+        # string id: string, and back
+        self.strings = []
+        self.stringIds = {}
+        # stanza id: (stanza name, Stanza), and name to id
+        self.stanzaTable = []
+        self.stanzaIds = {}
+        self.entryStanzas = array('I')
+        self.lineNums = array('L')
+        # the pairs of entry i are from pairStarts[i] to 
+        # pairStarts[i + 1], and the first srcCounts[i] are source
+        self.pairStarts = array('L', [0])
+        self.srcCounts = array('I')
+        self.marks = array('I')
+        self.paradigms = array('I')
+        self.extend(entries)
 
-def main(argv):
-    annotate = False
-    inPath = 'in'
-    outPath = ''
-    targetDictionary = 's'
-    
-    parser = argparse.ArgumentParser(
-        epilog= "NB: keynames in the internal 'stanza' variable must be adjusted to match input files"
-        )
-        
-    parser.add_argument("-a", "--annotate", 
-        default=False,
-        help="annotate the output with stanza information",
-        action="store_true"
-        )
+    def __len__(self):
+        return len(self.lineNums)
         
-    parser.add_argument("-l", "--lemmaFile",
-        default=False,
-        help="output lemmas to a file, one per line. Parses like the main parser (ignoring unknown stanza names etc.) Responds to -t, printing src/dst/all dictionary entries. Also responds to -a.",
-        action="store_true"
-        )
+    def _stringId(self, s):
+        i = self.stringIds.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.stringIds[s] = i
+            self.strings.append(s)
+        return i
         
-    parser.add_argument("-t", "--type",
-        choices=['s', 'd', 'bi', 'a'],
-        default='bi',
-        help="output dictionary type ('s': source monodix, 'd': destination monodix, or 'bi': bilingualdix. Default: 'bi')",
-        )
+    def append(self, entry):
+        stanzaId = self.stanzaIds.get(entry.stanzaName)
+        if stanzaId is None:
+            stanzaId = len(self.stanzaTable)
+            self.stanzaIds[entry.stanzaName] = stanzaId
+            self.stanzaTable.append((entry.stanzaName, entry.stanza))
+        self.entryStanzas.append(stanzaId)
+        self.lineNums.append(entry.lineNum)
+        self.srcCounts.append(len(entry.src))
+        stringId = self._stringId
+        marks = self.marks
+        paradigms = self.paradigms
+        for pairs in (entry.src, entry.dst):
+            for pair in pairs:
+                marks.append(stringId(pair.mark))
+                paradigms.append(stringId(pair.paradigm))
+        self.pairStarts.append(len(marks))
         
-    parser.add_argument("-o", "--outputBasename",
-        default='output',
-        help="output file name. Must not be a path (default: 'output')"
-        )
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
 
-    parser.add_argument("infiles", 
-        nargs='*',
-        help="files for input"
-        )
-        
-    args = parser.parse_args()
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('EntryStore index out of range')
+        stanzaName, stanza = self.stanzaTable[self.entryStanzas[i]]
+        start = self.pairStarts[i]
+        split = start + self.srcCounts[i]
+        end = self.pairStarts[i + 1]
+        strings = self.strings
+        marks = self.marks
+        paradigms = self.paradigms
+        new = _newTuple
+        return new(Entry, (
+            stanzaName,
+            stanza,
+            [new(MarkParadigmPair, (strings[marks[j]], strings[paradigms[j]])) for j in range(start, split)],
+            [new(MarkParadigmPair, (strings[marks[j]], strings[paradigms[j]])) for j in range(split, end)],
+            self.lineNums[i]
+            ))
+            
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
-    # assert infiles as absolute paths
-    args.infiles = [os.path.abspath(f) for f in args.infiles]
-    # test infiles exist
-    success = True
-    for f in args.infiles:
-        if (not os.path.exists(f)):
-            printError('Path not exists path: {0}'.format(f))
-            success = False
-            break
-        if (os.path.isdir(f)):
-            printError('Path is dir path: {0}'.format(f))
-            success = False
-            break
-    if (not success):
-        return 1
-        
-    # test basename is not a path
+    def tofile(self, f):
+        """
+        Write the store to a binary file. A line of JSON gives the
+        sizes, then follow the strings, joined by newlines, then the
+        columns, as array.tofile(). Each column is written in the
+        narrowest array type that holds its values.
+        """
+        blob = '\n'.join(self.strings).encode('utf-8', 'surrogateescape')
+        if blob.count(b'\n') != max(len(self.strings) - 1, 0):
+            raise ValueError('EntryStore strings can not hold newlines')
+        columns = []
+        for name in self.columns:
+            a = getattr(self, name)
+            top = max(a) if a else 0
+            for typecode in 'BHILQ':
+                if top >> (8 * array(typecode).itemsize) == 0:
+                    break
+            if typecode != a.typecode:
+                a = array(typecode, a)
+            columns.append(a)
+        layout = {
+            'byteorder': sys.byteorder,
+            'strings': len(self.strings),
+            'stringBytes': len(blob),
+            'stanzas': [name for name, _ in self.stanzaTable],
+            'columns': [[a.typecode, a.itemsize, len(a)] for a in columns]
+            }
+        f.write(json.dumps(layout, separators=(',', ':')).encode('ascii'))
+        f.write(b'\n')
+        f.write(blob)
+        for a in columns:
+            a.tofile(f)
+
+    @classmethod
+    def fromfile(cls, f, stanzaMap=None):
+        """
+        Read a store written by tofile(). Columns keep the types
+        they were written in, so the store is for reading, not
+        appending.
+        @param stanzaMap the Stanza of each stanza name. If None,
+        `stanzas`
+        @raise ValueError if the file is not a whole store, or was
+        written with other array types, or a stanza is not in
+        stanzaMap
+        """
+        if stanzaMap is None:
+            stanzaMap = stanzas
+        try:
+            layout = json.loads(f.readline())
+            if (layout['byteorder'] != sys.byteorder
+                or len(layout['columns']) != len(cls.columns)
+                ):
+                raise ValueError('EntryStore written on another platform')
+            store = cls()
+            blob = f.read(layout['stringBytes'])
+            if len(blob) != layout['stringBytes']:
+                raise ValueError('EntryStore strings cut short')
+            count = layout['strings']
+            store.strings = blob.decode('utf-8', 'surrogateescape').split('\n') if count else []
+            if len(store.strings) != count:
+                raise ValueError('EntryStore strings do not match their count')
+            for name in layout['stanzas']:
+                store.stanzaIds[name] = len(store.stanzaTable)
+                store.stanzaTable.append((name, stanzaMap[name]))
+            for name, (typecode, itemsize, length) in zip(cls.columns, layout['columns']):
+                a = array(typecode)
+                if a.itemsize != itemsize:
+                    raise ValueError('EntryStore written on another platform')
+                a.fromfile(f, length)
+                setattr(store, name, a)
+        except (KeyError, TypeError, EOFError) as e:
+            raise ValueError('EntryStore file not readable: {0}'.format(e))
+        return store
+
+
+def collectEntries(lines, parserClass=Parser, context=None):
+    """
+    Parse lines into an EntryStore.
+    @param lines any iterable of lines
+    @param context a Context, or None
+    @return an EntryStore
+    """
+    return EntryStore(iterEntries(lines, parserClass, context=context))
+
+
+def renderMonodix(entry, dictionaryType):
+    """
+    @param dictionaryType 's' or 'd'
+    @return monodix XML for an Entry
+    """
+    b = io.StringIO()
+    processLine(b, dictionaryType, entry.stanza, entry)
+    return b.getvalue()
+
+
+def renderBidix(entry):
+    """
+    @return bilingual dictionary XML for an Entry
+    """
+    b = io.StringIO()
+    processLine(b, 'bi', entry.stanza, entry)
+    return b.getvalue()
+
+
+def renderLemmas(entry, dictionaryType):
+    """
+    @param dictionaryType 's', 'd', or 'bi'/'a' for both sides
+    @return lemmas for an Entry, one per line
+    """
+    b = io.StringIO()
+    processLineForLemma(b, dictionaryType, entry)
+    return b.getvalue()
+
+
+def renderStanzaAnnotation(header, inPath):
+    """
+    @return annotation XML comments for a StanzaHeader
+    """
+    b = io.StringIO()
+    stanzaAnnotateTemplate(b, header.name, inPath)
+    return b.getvalue()
+
+
+def processLines(
+    fIn,
+    context,
+    annotate,
+    parserClass=Parser,
+    startLineNum=0,
+    startStanzaName=None
+    ):
+    """
+    Process lines, writing each parsed line to every target.
+    @param fIn an iterable of lines
+    @param context a Context. Output goes to the context outs.
+    @param parserClass one of the values in `parsers`
+    @param startLineNum number of the line before the first line
+    @param startStanzaName stanza name in force at the first line, 
+    or None. Not warned or annotated.
+    """
+    entries = iterEntries(
+        fIn,
+        parserClass,
+        startLineNum,
+        startStanzaName,
+        annotate,
+        context
+        )
+    try:
+        renderRecords(entries, context, annotate)
+    finally:
+        # messages are flushed as the parse ends
+        entries.close()
+
+
+def renderRecords(entries, context, annotate):
+    """
+    Write Entry records to every target.
+    @param entries an iterable of Entry and StanzaHeader. Headers are
+    written only if annotate is True.
+    @param context a Context. Output goes to the context outs.
+    """
+    inPath = context.inPath
+    outs = context.outs
+    stats = context.stats
+    if stats is not None:
+        clock = time.perf_counter
+        names = [targetName(target) for target, _ in outs]
+    check = context.check
+    pardefs = context.pardefs
+    if pardefs is not None:
+        checked = [
+            target.dictionaryType for target, _ in outs 
+            if not target.lemmas and target.dictionaryType in ('s', 'd')
+            ]
+    for e in entries:
+        if (type(e) is StanzaHeader):
+            if annotate:
+                for _, fOut in outs:
+                    stanzaAnnotateTemplate(fOut, e.name, inPath)
+            continue
+        if pardefs is not None:
+            checkParadigms(context, e, checked, pardefs)
+        if check:
+            checkEntry(context, e)
+        if stats is None:
+            for target, fOut in outs:
+                if target.lemmas:
+                    processLineForLemma(fOut, target.dictionaryType, e)
+                else:
+                    processLine(fOut, target.dictionaryType, e.stanza, e)
+        else:
+            start = clock()
+            for name, (target, fOut) in zip(names, outs):
+                if target.lemmas:
+                    b = lineLemmas(target.dictionaryType, e)
+                else:
+                    b = lineEntries(target.dictionaryType, e.stanza, e)
+                fOut.write(''.join(b))
+                stats.countEntries(name, e.stanzaName, len(b))
+            stats.times['render'] += clock() - start
+
+
+def checkEntry(context, entry):
+    """
+    Checks for --check, of what the parser accepts but can not be
+    rendered. Reports empty marks, and slashed paradigms with more 
+    letters after the '/' than the last word of the mark, which 
+    leave no stem (see monodixTemplate()).
+    """
+    for pairs in (entry.src, entry.dst):
+        for mark, paradigm in pairs:
+            lemma = mark.strip()
+            if not lemma:
+                context.diagnostic(
+                    entry.lineNum,
+                    'error',
+                    'empty-mark',
+                    "empty mark, with paradigm '{0}'".format(paradigm)
+                    )
+                continue
+            paradigm = paradigm.strip()
+            cut = paradigmCut(paradigm)
+            if cut:
+                word = lemma.rsplit(' ', 1)[-1]
+                if cut > len(word):
+                    context.diagnostic(
+                        entry.lineNum,
+                        'error',
+                        'paradigm-longer-than-mark',
+                        "paradigm '{0}' removes more than the mark '{1}'".format(paradigm, lemma)
+                        )
+
+
+def checkParadigms(context, entry, dictionaryTypes, pardefs):
+    """
+    Report paradigms of an entry which are not in pardefs.
+    @param dictionaryTypes 's' and/or 'd', the sides to check
+    """
+    baseParadigm = entry.stanza.baseParadigm
+    unknown = []
+    for dictionaryType in dictionaryTypes:
+        for pair in (entry.src if dictionaryType == 's' else entry.dst):
+            name = mkParadigm(pair.paradigm, baseParadigm)
+            if name not in pardefs and name not in unknown:
+                unknown.append(name)
+    for name in unknown:
+        context.diagnostic(
+            entry.lineNum,
+            'error',
+            'unknown-paradigm',
+            "paradigm not defined in the dictionary: '{0}'".format(name)
+            )
+
+
+# {dix path: ((mtime, size), frozenset of names)}
+_pardefNames = {}
+
+
+class _EndOfPardefs(Exception):
+    pass
+
+
+def readPardefs(dixPath, cache=None):
+    """
+    Names of the <pardef> elements of a dictionary.
+    The file is streamed with expat, and reading stops at the first
+    <section>. Results are kept by file mtime and size, in the 
+    process, and in cache if given.
+    @param cache a BuildCache, or None
+    @return a frozenset of names
+    """
+    st = os.stat(dixPath)
+    stamp = (st.st_mtime_ns, st.st_size)
+    known = _pardefNames.get(dixPath)
+    if known is not None and known[0] == stamp:
+        return known[1]
+    names = None
+    if cache is not None:
+        key = hashlib.sha256('pardefs\0{0}\0{1}\0{2}'.format(
+            os.path.abspath(dixPath),
+            stamp[0],
+            stamp[1]
+            ).encode('utf-8')).hexdigest()
+        names = cache.get(key)
+        if names is not None:
+            names = frozenset(names)
+    if names is None:
+        b = set()
+        def start(name, attrs):
+            if name == 'pardef':
+                n = attrs.get('n')
+                if n is not None:
+                    b.add(n)
+            elif name == 'section':
+                raise _EndOfPardefs()
+        p = expat.ParserCreate()
+        p.StartElementHandler = start
+        with open(dixPath, 'rb') as f:
+            try:
+                p.ParseFile(f)
+            except _EndOfPardefs:
+                pass
+            except expat.ExpatError as e:
+                raise ValueError('{0}: {1}'.format(dixPath, e))
+        names = frozenset(b)
+        if cache is not None:
+            cache.put(key, sorted(names))
+    _pardefNames[dixPath] = (stamp, names)
+    return names
+
+
+def _fileDigest(inPath):
+    h = hashlib.sha256()
+    with open(inPath, 'rb') as f:
+        for b in iter(lambda: f.read(outputBufferSize), b''):
+            h.update(b)
+    return h.hexdigest()
+
+
+def _stanzaKey(stanzaMap):
+    # compiled entries hold defaulted paradigms, so depend on the map
+    return repr(sorted((k, v.baseParadigm) for k, v in stanzaMap.items()))
+
+
+def compiledPath(inPath):
+    return inPath + compiledExtension
+
+
+class _DigestReader(io.RawIOBase):
+    # a binary file which adds the bytes read to a hash
+    def __init__(self, f, h):
+        self.f = f
+        self.h = h
+        
+    def readable(self):
+        return True
+        
+    def readinto(self, b):
+        n = self.f.readinto(b)
+        if n:
+            self.h.update(memoryview(b)[:n])
+        return n
+
+
+class _CompiledDiagnostics():
+    # Diagnostics sink for compileFile(), noting the place of each
+    # among the entries
+    def __init__(self, store, notes):
+        self.store = store
+        self.notes = notes
+        
+    def add(self, d):
+        self.notes.append([len(self.store), d.lineNum, d.severity, d.code, d.message])
+
+    def flush(self):
+        pass
+
+
+def compileFile(inPath, parserClass=Parser, stanzaMap=None, withStats=False):
+    """
+    Parse a file, and write the entries, stanza headers and 
+    diagnostics to its compiled file.
+    The compiled file starts with a line of JSON, holding the 
+    version, the source size, mtime and sha256, the stanza key, the
+    notes and the line counts. Then follows an EntryStore, from 
+    EntryStore.tofile(). Loading runs no code, and the columns are
+    read as arrays, not parsed.
+    @param withStats if True, store the line counts of a Stats. Slower.
+    @return a Compiled
+    """
+    st = os.stat(inPath)
+    store = EntryStore()
+    notes = []
+    ds = _CompiledDiagnostics(store, notes)
+    stats = Stats() if withStats else None
+    context = Context(inPath, stanzaMap=stanzaMap, stats=stats, diagnostics=ds)
+    # the source is hashed as it is read
+    h = hashlib.sha256()
+    with open(inPath, 'rb') as f:
+        raw = _DigestReader(f, h)
+        # decoded as open() would
+        module = compressorFor(inPath)
+        if module is None:
+            fIn = io.TextIOWrapper(io.BufferedReader(raw, outputBufferSize))
+        else:
+            fIn = module.open(io.BufferedReader(raw, outputBufferSize), 'rt')
+        with fIn:
+            for e in iterEntries(fIn, parserClass, headers=True, context=context):
+                if (type(e) is StanzaHeader):
+                    notes.append([len(store), e.lineNum, e.name])
+                else:
+                    store.append(e)
+            # any bytes a decompressor left unread
+            while raw.read(outputBufferSize):
+                pass
+    data = Compiled(
+        st.st_size,
+        st.st_mtime_ns,
+        h.hexdigest(),
+        _stanzaKey(context.stanzas),
+        store,
+        notes,
+        None if stats is None else dict(stats.counts)
+        )
+    _writeCompiled(compiledPath(inPath), data)
+    return data
+
+
+def _writeCompiled(cPath, data):
+    tmpPath = cPath + '.tmp'
+    header = {
+        'version': compiledVersion,
+        'size': data.size,
+        'mtime': data.mtime,
+        'sha256': data.sha256,
+        'stanzaKey': data.stanzaKey,
+        'notes': data.notes,
+        'counts': data.counts
+        }
+    try:
+        with open(tmpPath, 'wb') as f:
+            f.write(json.dumps(header, separators=(',', ':')).encode('ascii'))
+            f.write(b'\n')
+            data.store.tofile(f)
+        os.replace(tmpPath, cPath)
+    except (OSError, ValueError) as e:
+        # still usable, from memory
+        _silentRemove(tmpPath)
+        printWarning('compiled file not written: {0}: {1}'.format(cPath, e))
+
+
+def loadCompiled(inPath, stanzaMap=None):
+    """
+    Load the compiled file of a source file, if it is up to date.
+    A compiled file is out of date if the source size, or content,
+    or the stanza map, has changed. If only the source mtime has 
+    changed, the compiled file is stamped with the new time.
+    @return a Compiled, or None
+    """
+    if stanzaMap is None:
+        stanzaMap = stanzas
+    cPath = compiledPath(inPath)
+    try:
+        with open(cPath, 'rb') as f:
+            header = json.loads(f.readline())
+            st = os.stat(inPath)
+            if (type(header) is not dict
+                or header.get('version') != compiledVersion
+                or header.get('size') != st.st_size
+                or header.get('stanzaKey') != _stanzaKey(stanzaMap)
+                ):
+                return None
+            data = Compiled(
+                header['size'],
+                header['mtime'],
+                header['sha256'],
+                header['stanzaKey'],
+                EntryStore.fromfile(f, stanzaMap),
+                header['notes'],
+                header['counts']
+                )
+    except Exception:
+        # missing, or unreadable
+        return None
+    if data.mtime != st.st_mtime_ns:
+        # touched, but maybe not changed
+        if data.sha256 != _fileDigest(inPath):
+            return None
+        data = data._replace(mtime=st.st_mtime_ns)
+        _writeCompiled(cPath, data)
+    return data
+
+
+def compiledRecords(data, stanzaMap=None, headers=False, context=None):
+    """
+    @param data a Compiled, from compileFile() or loadCompiled()
+    @param headers if True, also yield StanzaHeader records
+    @param context if given, the diagnostics of the parse are added
+    to it, in their places among the records
+    @return a generator of Entry (and StanzaHeader), as iterEntries()
+    """
+    if stanzaMap is None:
+        stanzaMap = stanzas
+    new = _newTuple
+    store = data.store
+    strings = store.strings
+    stanzaTable = store.stanzaTable
+    marks = store.marks
+    paradigms = store.paradigms
+    starts = store.pairStarts
+    notes = data.notes
+    nIdx = 0
+    nEnd = len(notes)
+    for i, (stanzaId, lineNum, start, end, srcCount) in enumerate(zip(
+        store.entryStanzas,
+        store.lineNums,
+        starts,
+        islice(starts, 1, None),
+        store.srcCounts
+        )):
+        while nIdx < nEnd and notes[nIdx][0] <= i:
+            n = notes[nIdx]
+            nIdx += 1
+            if len(n) == 3:
+                if headers:
+                    yield StanzaHeader(n[2], stanzaMap[n[2]], n[1])
+            elif context is not None:
+                context.diagnostic(*n[1:])
+        split = start + srcCount
+        stanzaName, stanza = stanzaTable[stanzaId]
+        yield new(Entry, (
+            stanzaName,
+            stanza,
+            [new(MarkParadigmPair, (strings[marks[j]], strings[paradigms[j]])) for j in range(start, split)],
+            [new(MarkParadigmPair, (strings[marks[j]], strings[paradigms[j]])) for j in range(split, end)],
+            lineNum
+            ))
+    for n in notes[nIdx:]:
+        if len(n) == 3:
+            if headers:
+                yield StanzaHeader(n[2], stanzaMap[n[2]], n[1])
+        elif context is not None:
+            context.diagnostic(*n[1:])
+
+
+def processCompiled(context, annotate, parserClass=Parser):
+    """
+    As processLines(), but from the compiled file of context.inPath.
+    The compiled file is made first, if missing or out of date. 
+    Diagnostics from the parse are reported again.
+    """
+    inPath = context.inPath
+    stats = context.stats
+    start = time.perf_counter()
+    data = loadCompiled(inPath, context.stanzas)
+    if data is None or (stats is not None and data.counts is None):
+        data = compileFile(inPath, parserClass, context.stanzas, stats is not None)
+    if stats is not None:
+        stats.times['read'] += time.perf_counter() - start
+        for k, v in data.counts.items():
+            stats.counts[k] += v
+    renderRecords(compiledRecords(data, context.stanzas, annotate, context), context, annotate)
+    context.flush()
+
+
+class BuildCache():
+    """
+    On-disk cache of rendered blocks of input, keyed by content hash.
+    Values are JSON, so a cache in a shared directory can not run
+    code when read. When the cache is over its size limit, evict() 
+    removes the least recently used entries.
+    """
+    # change if cached values change
+    version = '2'
+
+    def __init__(self, path, maxBytes=cacheSize):
+        self.path = path
+        self.maxBytes = maxBytes
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        
+    def _entryPath(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        """
+        @return the cached value, or None
+        """
+        entryPath = self._entryPath(key)
+        try:
+            with open(entryPath, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # mark as recently used
+            os.utime(entryPath, None)
+        except Exception:
+            # missing, or unreadable, is a miss
+            return None
+        return value
+        
+    def put(self, key, value):
+        """
+        @param value lists, dicts, str, int and None, as JSON
+        """
+        entryPath = self._entryPath(key)
+        d = os.path.dirname(entryPath)
+        if not os.path.isdir(d):
+            os.makedirs(d, exist_ok=True)
+        # written aside, then renamed, so readers see whole entries
+        tmpPath = '{0}.{1}-{2}.tmp'.format(entryPath, os.getpid(), threading.get_ident())
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(value, f, separators=(',', ':'))
+        os.replace(tmpPath, entryPath)
+        
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is 
+        within maxBytes.
+        @return number of entries removed
+        """
+        entries = []
+        total = 0
+        for dirPath, _, names in os.walk(self.path):
+            for name in names:
+                entryPath = os.path.join(dirPath, name)
+                try:
+                    st = os.stat(entryPath)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entryPath))
+                total += st.st_size
+        removed = 0
+        if total > self.maxBytes:
+            entries.sort()
+            for _, size, entryPath in entries:
+                if total <= self.maxBytes:
+                    break
+                _silentRemove(entryPath)
+                total -= size
+                removed += 1
+        return removed
+
+
+class MemoryCache():
+    """
+    In-process cache, with the methods of BuildCache.
+    evict() keeps only the entries used since the last evict().
+    """
+    def __init__(self):
+        self.entries = {}
+        self.used = set()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.used.add(key)
+        return value
+        
+    def put(self, key, value):
+        self.entries[key] = value
+        self.used.add(key)
+
+    def evict(self):
+        removed = len(self.entries) - len(self.used)
+        self.entries = {k: self.entries[k] for k in self.used}
+        self.used = set()
+        return removed
+
+
+def iterBlocks(lines, startLineNum=0, startStanzaName=None, blockLines=cacheBlockLines):
+    """
+    Split lines into blocks, for caching.
+    Blocks end before stanza headers, and after lines chosen by 
+    their content, so an edit moves few block boundaries.
+    @return a generator of (number of the line before the block, 
+    stanza name in force at the start or None, list of lines)
+    """
+    stanzaName = startStanzaName
+    blockStart = startLineNum
+    blockStanzaName = startStanzaName
+    lineNum = startLineNum
+    b = []
+    for l in lines:
+        line = l.strip()
+        if line and line[0] == '=':
+            if b:
+                yield blockStart, blockStanzaName, b
+                b = []
+            blockStart = lineNum
+            # the header sets the stanza
+            blockStanzaName = None
+            stanzaName = suffix(line, '=').strip().lower()
+        b.append(l)
+        lineNum += 1
+        if zlib.crc32(l.encode('utf-8', 'surrogateescape')) % blockLines == 0:
+            yield blockStart, blockStanzaName, b
+            b = []
+            blockStart = lineNum
+            blockStanzaName = stanzaName
+    if b:
+        yield blockStart, blockStanzaName, b
+
+
+def processLinesCached(
+    fIn,
+    context,
+    annotate,
+    parserClass,
+    cache,
+    startLineNum=0,
+    startStanzaName=None
+    ):
+    """
+    As processLines(), but blocks of input are rendered from a 
+    BuildCache if they are unchanged. Changed blocks are parsed, and
+    stored. Cached diagnostics are reported with updated line numbers.
+    """
+    inPath = context.inPath
+    outs = context.outs
+    stats = context.stats
+    targets = [target for target, _ in outs]
+    keyPrefix = '\0'.join([
+        BuildCache.version,
+        repr(targets),
+        repr(annotate),
+        # in annotations
+        os.path.basename(inPath) if annotate else '',
+        repr(sorted((k, v.baseParadigm) for k, v in context.stanzas.items())),
+        # paradigm messages depend on the names
+        '' if context.pardefs is None else hashlib.sha256('\n'.join(sorted(context.pardefs)).encode('utf-8')).hexdigest(),
+        repr(context.check)
+        ])
+    for blockStart, blockStanzaName, block in iterBlocks(fIn, startLineNum, startStanzaName):
+        h = hashlib.sha256(keyPrefix.encode('utf-8'))
+        h.update(('\0' + (blockStanzaName or '') + '\0').encode('utf-8'))
+        h.update(''.join(block).encode('utf-8', 'surrogateescape'))
+        key = h.hexdigest()
+        value = cache.get(key)
+        # blocks stored without --stats have no counts
+        cached = value is not None and (stats is None or value[2] is not None)
+        if cached:
+            texts, ds, counts = value
+            ds = [Diagnostic(*d) for d in ds]
+            if counts is not None:
+                blockStats = Stats()
+                blockStats.counts.update(counts['counts'])
+                blockStats.entries = counts['entries']
+        if not cached:
+            blockOuts = [(target, io.StringIO()) for target in targets]
+            ds = _DiagnosticList()
+            blockStats = None if stats is None else Stats()
+            blockContext = Context(
+                inPath,
+                blockOuts,
+                context.stanzas,
+                stats=blockStats,
+                diagnostics=ds,
+                pardefs=context.pardefs,
+                check=context.check
+                )
+            processLines(block, blockContext, annotate, parserClass, blockStart, blockStanzaName)
+            texts = [fOut.getvalue() for _, fOut in blockOuts]
+            # line numbers in the block
+            ds = [d._replace(path=None, lineNum=None if d.lineNum is None else d.lineNum - blockStart) for d in ds]
+            cache.put(key, [
+                texts,
+                ds,
+                None if blockStats is None else {'counts': blockStats.counts, 'entries': blockStats.entries}
+                ])
+        for (_, fOut), text in zip(outs, texts):
+            fOut.write(text)
+        for d in ds:
+            context.diagnostics.add(d._replace(
+                path=inPath,
+                lineNum=None if d.lineNum is None else d.lineNum + blockStart
+                ))
+        if stats is not None:
+            if cached:
+                # no time was spent on the block
+                stats.addCounts(blockStats)
+                stats.counts['cachedLines'] += blockStats.counts['lines']
+            else:
+                stats.add(blockStats)
+    context.flush()
+
+
+class EntryIndex():
+    """
+    Exact index of entry keys, in memory.
+    """
+    def __init__(self):
+        self.keys = set()
+        
+    def add(self, key):
+        """
+        @return True if the key was not in the index
+        """
+        keys = self.keys
+        n = len(keys)
+        keys.add(key)
+        return len(keys) != n
+
+    def filterLines(self, lines):
+        """
+        Add entry lines, those starting '<e', to the index.
+        @return (lines not in the index, entry lines which were)
+        """
+        keys = self.keys
+        kept = []
+        removed = []
+        for line in lines:
+            if line.startswith('<e'):
+                if line in keys:
+                    removed.append(line)
+                    continue
+                keys.add(line)
+            kept.append(line)
+        return kept, removed
+
+    def close(self):
+        self.keys = set()
+
+
+class SpillingEntryIndex():
+    """
+    Index of entry keys, in bounded memory.
+    A Bloom filter of fixed size answers for most new keys. Keys the
+    filter may have seen are checked in an SQLite table, in a 
+    temporary file. Keys are stored as 128 bit digests.
+    """
+    def __init__(self, filterBytes, hashes=4, tmpDir=None):
+        self.bits = filterBytes * 8
+        self.filter = bytearray(filterBytes)
+        self.hashes = hashes
+        fd, self.path = tempfile.mkstemp(prefix='skel2dix-dedup-', dir=tmpDir)
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        # a scratch file, so no journal or syncs
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('CREATE TABLE entryKey (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+
+    def add(self, key):
+        """
+        @return True if the key was not in the index
+        """
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bits = self.bits
+        f = self.filter
+        seen = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % bits
+            mask = 1 << (bit & 7)
+            if not f[bit >> 3] & mask:
+                f[bit >> 3] |= mask
+                seen = False
+        if seen and self.conn.execute(
+            'SELECT 1 FROM entryKey WHERE digest = ?', (digest,)
+            ).fetchone() is not None:
+            return False
+        self.conn.execute('INSERT INTO entryKey VALUES (?)', (digest,))
+        return True
+
+    def filterLines(self, lines):
+        """
+        Add entry lines, those starting '<e', to the index.
+        @return (lines not in the index, entry lines which were)
+        """
+        kept = []
+        removed = []
+        for line in lines:
+            if line.startswith('<e') and not self.add(line):
+                removed.append(line)
+            else:
+                kept.append(line)
+        return kept, removed
+
+    def close(self):
+        self.conn.close()
+        _silentRemove(self.path)
+
+
+class Dedup():
+    """
+    Drops repeated entries from dictionary outputs, over a whole run.
+    Each output has an index of the entry lines written to it, so a
+    repeat is dropped if it comes from the same line, or another
+    file. Lemma outputs are not deduplicated.
+    """
+    def __init__(self, diagnostics=None, memoryBytes=None, tmpDir=None):
+        """
+        @param diagnostics a Diagnostics, for a message on each 
+        removed entry, or None
+        @param memoryBytes if not None, each index is a 
+        SpillingEntryIndex with a filter of this size
+        """
+        self.diagnostics = diagnostics
+        self.memoryBytes = memoryBytes
+        self.tmpDir = tmpDir
+        # {outPath: index}
+        self.indexes = {}
+        # {outPath: count}
+        self.removed = {}
+        
+    def index(self, outPath):
+        outPath = _finalPath(outPath)
+        index = self.indexes.get(outPath)
+        if index is None:
+            if self.memoryBytes is None:
+                index = EntryIndex()
+            else:
+                index = SpillingEntryIndex(self.memoryBytes, tmpDir=self.tmpDir)
+            self.indexes[outPath] = index
+            self.removed[outPath] = 0
+        return index
+        
+    def wrap(self, target, fOut, outPath):
+        """
+        @return fOut, or a DedupOutput writing to it
+        """
+        if target.lemmas:
+            return fOut
+        return DedupOutput(fOut, self, outPath)
+        
+    def duplicates(self, outPath, lines):
+        # temporary outputs are reported by the name they will have
+        outPath = _finalPath(outPath)
+        self.removed[outPath] += len(lines)
+        diagnostics = self.diagnostics
+        # messages are many, so skipped if they would go nowhere
+        if diagnostics is not None and not (diagnostics.quiet and diagnostics.jsonOut is None):
+            name = os.path.basename(outPath)
+            for line in lines:
+                diagnostics.add(Diagnostic(
+                    outPath, 
+                    None,
+                    'info',
+                    'duplicate',
+                    'duplicate entry removed from {0}: {1}'.format(name, line.rstrip('\n'))
+                    ))
+                
+    def close(self):
+        for index in self.indexes.values():
+            index.close()
+            
+    def report(self, fOut):
+        for outPath in sorted(self.removed):
+            fOut.write('[dedup] {0}: {1} duplicate entries removed\n'.format(
+                outPath,
+                self.removed[outPath]
+                ))
+
+
+class DedupOutput():
+    """
+    Output which drops entry lines already written.
+    Entries are whole lines, starting '<e'. Other lines, like 
+    annotations, are written as given. Writes are gathered, and 
+    filtered in batches.
+    """
+    def __init__(self, fOut, dedup, outPath, batchSize=64 * 1024):
+        self.fOut = fOut
+        self.dedup = dedup
+        self.outPath = outPath
+        self.index = dedup.index(outPath)
+        self.batchSize = batchSize
+        self.pending = []
+        self.pendingSize = 0
+        
+    def write(self, text):
+        self.pending.append(text)
+        self.pendingSize += len(text)
+        if self.pendingSize >= self.batchSize:
+            self.flush()
+            
+    def flush(self):
+        if not self.pending:
+            return
+        kept, removed = self.index.filterLines(''.join(self.pending).splitlines(True))
+        self.pending = []
+        self.pendingSize = 0
+        if removed:
+            self.dedup.duplicates(self.outPath, removed)
+        self.fOut.write(''.join(kept))
+        
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.fOut.close()
+
+
+def monodixSortKey(line):
+    """
+    Sort key for a monodix entry: the base paradigm (the stanza tag),
+    the lemma, then the whole line.
+    """
+    # <e lm="tatty"><i>tatt</i><par n="bab/y__n"/></e>
+    i = line.find(' lm="') + 5
+    lemma = line[i:line.find('"', i)]
+    i = line.rfind('<par n="') + 8
+    paradigm = line[i:line.find('"', i)]
+    return (paradigm.rpartition('__')[2], lemma, line)
+
+
+def bidixSortKey(line):
+    """
+    Sort key for a bidix entry: the tag (the stanza tag), the left 
+    mark, the right mark, then the whole line.
+    """
+    # <e><p><l>snack<s n="n"/></l><r>baggin<s n="n"/></r></p></e>
+    i = line.find('<l>') + 3
+    j = line.find('<s n="', i)
+    left = line[i:j]
+    tag = line[j + 6:line.find('"', j + 6)]
+    i = line.find('<r>', j) + 3
+    right = line[i:line.find('<s n="', i)]
+    return (tag, left, right, line)
+
+
+def lemmaSortKey(line):
+    return line
+
+
+class SortRuns():
+    """
+    Lines of one output, for an external merge sort. Lines are 
+    held in memory, and sorted runs written to temporary files when 
+    the Sorter says so. Reading merges the runs and held lines.
+    """
+    def __init__(self, outPath, keyFn, tmpDir=None):
+        self.outPath = outPath
+        self.keyFn = keyFn
+        self.tmpDir = tmpDir
+        self.lines = []
+        self.size = 0
+        # paths of sorted temporary files
+        self.runs = []
+
+    def add(self, lines):
+        """
+        @return estimated bytes of memory added
+        """
+        size = 0
+        for line in lines:
+            size += len(line)
+        size = size * 2 + len(lines) * sortLineOverhead
+        self.lines.extend(lines)
+        self.size += size
+        return size
+        
+    def _openRun(self, path, mode):
+        return open(path, mode, encoding='utf-8', errors='surrogateescape', newline='')
+        
+    def _writeRun(self, lines):
+        fd, path = tempfile.mkstemp(prefix='skel2dix-sort-', dir=self.tmpDir)
+        os.close(fd)
+        self.runs.append(path)
+        with self._openRun(path, 'w') as f:
+            f.writelines(lines)
+        
+    def spill(self):
+        """
+        Write the held lines, sorted, as a run.
+        @return estimated bytes of memory freed
+        """
+        size = self.size
+        self.lines.sort(key=self.keyFn)
+        self._writeRun(self.lines)
+        self.lines = []
+        self.size = 0
+        if len(self.runs) >= sortMergeFanIn:
+            runs = self.runs
+            self.runs = []
+            fIns = [self._openRun(path, 'r') for path in runs]
+            try:
+                self._writeRun(heapq.merge(*fIns, key=self.keyFn))
+            finally:
+                for f in fIns:
+                    f.close()
+                for path in runs:
+                    _silentRemove(path)
+        return size
+        
+    def sortedLines(self):
+        """
+        Iterate every line, in order. Runs are open until the 
+        iteration ends.
+        """
+        self.lines.sort(key=self.keyFn)
+        fIns = [self._openRun(path, 'r') for path in self.runs]
+        try:
+            yield from heapq.merge(self.lines, *fIns, key=self.keyFn)
+        finally:
+            for f in fIns:
+                f.close()
+
+    def close(self):
+        self.lines = []
+        for path in self.runs:
+            _silentRemove(path)
+        self.runs = []
+
+
+class Sorter():
+    """
+    Sorts entries in the outputs, over a whole run.
+    Outputs are wrapped in SortingOutput, which hold the entry 
+    lines, not writing them. After the run, finish() writes each 
+    output sorted. Dictionary entries are grouped by stanza tag, 
+    then ordered by lemma (monodix) or left and right marks (bidix).
+    Lemma files are ordered by lemma. Memory is capped, lines over
+    the cap are sorted into runs in temporary files, and the runs
+    merged.
+    """
+    def __init__(self, memoryBytes=sortMemory, tmpDir=None, unique=False, annotate=False):
+        """
+        @param memoryBytes estimated memory for held lines, over 
+        all outputs
+        @param unique if True, repeated lines are written once
+        @param annotate if True, each group of dictionary entries 
+        has a comment with its stanza tag
+        """
+        self.memoryBytes = memoryBytes
+        self.tmpDir = tmpDir
+        self.unique = unique
+        self.annotate = annotate
+        self.size = 0
+        # {outPath: (target, SortRuns)}
+        self.outputs = {}
+        
+    def runs(self, target, outPath):
+        b = self.outputs.get(outPath)
+        if b is None:
+            if target.lemmas:
+                keyFn = lemmaSortKey
+            elif target.dictionaryType == 'bi':
+                keyFn = bidixSortKey
+            else:
+                keyFn = monodixSortKey
+            b = (target, SortRuns(outPath, keyFn, self.tmpDir))
+            self.outputs[outPath] = b
+        return b[1]
+        
+    def wrap(self, target, fOut, outPath):
+        """
+        @return a SortingOutput writing to fOut
+        """
+        return SortingOutput(fOut, self, self.runs(target, outPath), target.lemmas)
+        
+    def add(self, runs, lines):
+        self.size += runs.add(lines)
+        while self.size > self.memoryBytes:
+            # the largest output is written out
+            largest = max((b[1] for b in self.outputs.values()), key=lambda r: r.size)
+            if not largest.lines:
+                break
+            self.size -= largest.spill()
+            
+    def finish(self, bufferSize=outputBufferSize, compressThread=False):
+        """
+        Write each output, sorted. Output is appended.
+        """
+        for outPath, (target, runs) in self.outputs.items():
+            fOut = openOutput(outPath, bufferSize, compressThread)
+            try:
+                group = None
+                previous = None
+                for line in runs.sortedLines():
+                    if self.unique and line == previous:
+                        continue
+                    previous = line
+                    if self.annotate and not target.lemmas:
+                        tag = runs.keyFn(line)[0]
+                        if tag != group:
+                            fOut.write('\n<!-- ' + tag + ' -->\n')
+                            group = tag
+                    fOut.write(line)
+            finally:
+                fOut.close()
+            self.size -= runs.size
+            runs.close()
+                
+    def close(self):
+        for _, runs in self.outputs.values():
+            runs.close()
+
+
+class SortingOutput():
+    """
+    Output which gives entry lines to a Sorter, and drops others. 
+    For dictionaries, entries are lines starting '<e'. For lemma 
+    files, lines which are not blank or annotation. Writes are 
+    gathered, and given in batches. Nothing is written to the 
+    wrapped output, which is closed with this.
+    """
+    def __init__(self, fOut, sorter, runs, lemmas, batchSize=64 * 1024):
+        self.fOut = fOut
+        self.sorter = sorter
+        self.sortRuns = runs
+        self.lemmas = lemmas
+        self.batchSize = batchSize
+        self.pending = []
+        self.pendingSize = 0
+        
+    def write(self, text):
+        self.pending.append(text)
+        self.pendingSize += len(text)
+        if self.pendingSize >= self.batchSize:
+            self.flush()
+            
+    def flush(self):
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        self.pending = []
+        self.pendingSize = 0
+        if self.lemmas:
+            lines = [l for l in text.splitlines(True) if l.strip() and not l.startswith('<!--')]
+        else:
+            lines = [l for l in text.splitlines(True) if l.startswith('<e')]
+        self.sorter.add(self.sortRuns, lines)
+        
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.fOut.close()
+
+
+
+class StreamOutput():
+    """
+    Writes to a stream (stdout) in blocks, flushing each block, so 
+    a reader down a pipe gets output as it is made. The stream is
+    not closed.
+    """
+    def __init__(self, stream, bufferSize=outputBufferSize):
+        self.stream = stream
+        self.bufferSize = bufferSize
+        self.b = []
+        self.size = 0
+        
+    def write(self, text):
+        self.b.append(text)
+        self.size += len(text)
+        if self.size >= self.bufferSize:
+            self.flush()
+            
+    def flush(self):
+        self.stream.write(''.join(self.b))
+        self.stream.flush()
+        self.b = []
+        self.size = 0
+        
+    def close(self):
+        self.flush()
+
+
+def compressorFor(path):
+    """
+    @return the module for a compressed path (by extension), or None
+    """
+    return compressors.get(os.path.splitext(path)[1])
+
+
+class CompressedOutput():
+    """
+    Writes text to a compressed file, in blocks. Optionally, blocks
+    are compressed on a thread, so parsing goes on meanwhile (the
+    compressors release the GIL). The thread takes blocks from a 
+    short queue, so if it falls behind, writes wait.
+    Appending to a compressed file adds a stream to it. 
+    Decompressors read the streams as one.
+    """
+    def __init__(self, outPath, module, bufferSize=outputBufferSize, thread=False):
+        if module is gzip:
+            # level 6, as the gzip command. gzip.open() uses 9, 5x 
+            # slower. The header holds the final name and mtime 0, 
+            # so the same text is the same bytes, at any time, from 
+            # any _tmpPath()
+            self.raw = open(outPath, 'ab')
+            self.fOut = gzip.GzipFile(
+                os.path.basename(_finalPath(outPath)),
+                'wb',
+                6,
+                self.raw,
+                mtime=0
+                )
+        else:
+            self.raw = None
+            self.fOut = module.open(outPath, 'ab')
+        self.bufferSize = bufferSize
+        # as open() would encode
+        self.encoding = locale.getpreferredencoding(False)
+        self.b = []
+        self.size = 0
+        self.queue = None
+        self.error = None
+        if thread:
+            self.queue = queue.Queue(2)
+            self.thread = threading.Thread(target=self._compress, daemon=True)
+            self.thread.start()
+            
+    def _compress(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            if self.error is None:
+                try:
+                    self.fOut.write(data)
+                except Exception as e:
+                    # raised on the next write
+                    self.error = e
+        
+    def write(self, text):
+        self.b.append(text)
+        self.size += len(text)
+        if self.size >= self.bufferSize:
+            self.flush()
+            
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        data = ''.join(self.b).encode(self.encoding)
+        self.b = []
+        self.size = 0
+        if self.queue is None:
+            self.fOut.write(data)
+        elif data:
+            self.queue.put(data)
+        
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.queue is not None:
+                self.queue.put(None)
+                self.thread.join()
+            try:
+                self.fOut.close()
+            finally:
+                # GzipFile does not close a file it is given
+                if self.raw is not None:
+                    self.raw.close()
+        if self.error is not None:
+            raise self.error
+            
+
+def openOutput(outPath, bufferSize=outputBufferSize, compressThread=False):
+    """
+    Open an output file for appending.
+    Paths ending '.gz', '.bz2' or '.xz' are compressed.
+    @param outPath a path, or '-' for stdout
+    @param bufferSize text is written to disk in blocks of this size
+    @param compressThread if True, compress on a thread
+    """
+    if outPath == streamPath:
+        return StreamOutput(outputStream or sys.stdout, bufferSize)
+    module = compressorFor(outPath)
+    if module is not None:
+        return CompressedOutput(outPath, module, bufferSize, compressThread)
+    return open(outPath, 'a', buffering=bufferSize)
+
+
+def openInput(inPath):
+    """
+    Open an input file as text.
+    Paths ending '.gz', '.bz2' or '.xz' are decompressed as read.
+    @param inPath a path, or '-' for stdin
+    """
+    if inPath == streamPath:
+        # decoded as open() would. stdin is not closed
+        return open(sys.stdin.fileno(), 'r', closefd=False)
+    module = compressorFor(inPath)
+    if module is not None:
+        return module.open(inPath, 'rt')
+    return open(inPath, 'r')
+
+
+def closeOutputs(fOuts):
+    """
+    Close every output, even if some fail. The first error is
+    raised after all are closed.
+    """
+    error = None
+    for fOut in fOuts:
+        try:
+            fOut.close()
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def wrapOutputs(outs, targetPaths, sorter=None, dedup=None):
+    """
+    Wrap outputs for --sort and --dedup. The Sorter wraps first, so
+    the Dedup sees entries before they are held for sorting. 
+    Closing a wrapper closes the output it wraps, so closeOutputs()
+    on the result closes all.
+    @param outs list of (Target, fOut), one for each of targetPaths
+    @param sorter a Sorter, or None
+    @param dedup a Dedup, or None
+    @return list of (Target, fOut)
+    """
+    if sorter is not None:
+        outs = [(target, sorter.wrap(target, fOut, outPath)) for (target, fOut), (_, outPath) in zip(outs, targetPaths)]
+    if dedup is not None:
+        outs = [(target, dedup.wrap(target, fOut, outPath)) for (target, fOut), (_, outPath) in zip(outs, targetPaths)]
+    return outs
+
+
+class _PipelineStop(Exception):
+    pass
+
+
+class StageQueue():
+    """
+    A bounded queue between two pipeline stages. When it is full,
+    puts wait, so a slow stage holds back the stages before it.
+    Counts the depth at each put, and the time spent waiting.
+    """
+    def __init__(self, name, depth, stop=None):
+        """
+        @param stop a threading.Event, or None. When set, waiting
+        puts raise _PipelineStop
+        """
+        self.name = name
+        self.queue = queue.Queue(depth)
+        self.stop = stop
+        self.puts = 0
+        self.depthTotal = 0
+        self.maxDepth = 0
+        self.putWait = 0.0
+        self.getWait = 0.0
+        
+    def put(self, item):
+        depth = self.queue.qsize()
+        self.puts += 1
+        self.depthTotal += depth
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+        start = time.perf_counter()
+        if self.stop is None:
+            self.queue.put(item)
+        else:
+            while True:
+                if self.stop.is_set():
+                    raise _PipelineStop()
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+        self.putWait += time.perf_counter() - start
+        
+    def get(self):
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.getWait += time.perf_counter() - start
+        return item
+
+        
+class PipeOutput():
+    """
+    An output written on its own thread. Text is passed to the 
+    thread in batches. If the thread fails, the error is raised on 
+    the next write, or on close. The thread goes on taking batches,
+    so writes never wait on a dead thread.
+    """
+    def __init__(self, fOut, stageQueue, batchSize=pipelineBatchSize):
+        self.fOut = fOut
+        self.queue = stageQueue
+        self.batchSize = batchSize
+        self.b = []
+        self.size = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+        
+    def _write(self):
+        while True:
+            text = self.queue.get()
+            if text is None:
+                return
+            if self.error is None:
+                try:
+                    self.fOut.write(text)
+                except Exception as e:
+                    self.error = e
+                    
+    def write(self, text):
+        self.b.append(text)
+        self.size += len(text)
+        if self.size >= self.batchSize:
+            if self.error is not None:
+                raise self.error
+            self.queue.put(''.join(self.b))
+            self.b = []
+            self.size = 0
+            
+    def close(self):
+        try:
+            if self.b:
+                self.queue.put(''.join(self.b))
+                self.b = []
+            self.queue.put(None)
+            self.thread.join()
+        finally:
+            self.fOut.close()
+        if self.error is not None:
+            raise self.error
+
+
+class Pipeline():
+    """
+    Threads for --pipeline, over one input file. A reader passes
+    batches of lines to the main thread, which parses and renders,
+    and a writer thread for each output writes the rendered text. 
+    Stages are linked by StageQueue.
+    """
+    def __init__(self, depth=pipelineDepth):
+        self.depth = depth
+        self.stop = threading.Event()
+        self.queues = []
+        self.reader = None
+        
+    def _queue(self, name, stop=None):
+        q = StageQueue(name, self.depth, stop)
+        self.queues.append(q)
+        return q
+        
+    def lines(self, fIn, batchLines=pipelineBatchLines):
+        """
+        Read lines on a thread.
+        @return an iterable of the lines of fIn
+        """
+        # writers take every batch, but the reader is stopped if 
+        # parsing ends early
+        q = self._queue('read', self.stop)
+        
+        def read():
+            try:
+                b = []
+                for line in fIn:
+                    b.append(line)
+                    if len(b) >= batchLines:
+                        q.put(b)
+                        b = []
+                q.put(b)
+                q.put(None)
+            except _PipelineStop:
+                pass
+            except Exception as e:
+                try:
+                    q.put(e)
+                except _PipelineStop:
+                    pass
+                    
+        def lines():
+            while True:
+                b = q.get()
+                if b is None:
+                    return
+                if isinstance(b, Exception):
+                    raise b
+                yield from b
+                
+        self.reader = threading.Thread(target=read, daemon=True)
+        self.reader.start()
+        return lines()
+        
+    def output(self, name, fOut):
+        """
+        @return fOut, written on a thread
+        """
+        return PipeOutput(fOut, self._queue(name))
+
+    def stopReading(self):
+        """
+        Stop the reader, if it has not finished. Call before the 
+        input is closed.
+        """
+        self.stop.set()
+        if self.reader is not None:
+            self.reader.join()
+            self.reader = None
+            
+    def close(self, stats=None):
+        """
+        @param stats a Stats, to count the queues into, or None
+        """
+        self.stopReading()
+        if stats is not None:
+            for q in self.queues:
+                stats.countQueue(q)
+
+
+def processTargets(
+    inPath,
+    targetPaths,
+    annotate,
+    parserClass=Parser,
+    *,
+    bufferSize=outputBufferSize,
+    stats=None,
+    diagnostics=None,
+    cache=None,
+    compiled=False,
+    dedup=None,
+    pardefs=None,
+    compressThread=False,
+    pipelineDepth=None,
+    check=False,
+    chunk=None,
+    sorter=None
+    ):
+    """
+    Process a file, stepping by line.
+    Each line is parsed once, then written to every target.
+    Parameters after parserClass are keyword-only.
+    @param targetPaths list of (Target, outPath). Output is appended. 
+    @param parserClass one of the values in `parsers`
+    @param bufferSize output is written to disk in blocks of this size
+    @param stats a Stats to count into, or None
+    @param diagnostics a Diagnostics, or None to print messages
+    @param cache a BuildCache, or None
+    @param compiled if True, render from the compiled file. The 
+    cache is not used.
+    @param dedup a Dedup, or None
+    @param pardefs a set of paradigm names to check against, or None
+    @param compressThread if True, compressed outputs are compressed
+    on threads
+    @param pipelineDepth if not None, read and write on threads,
+    with queues of this many batches. See Pipeline
+    @param check if True, entries are checked by checkEntry()
+    @param chunk a Chunk, to process only that part of the file, or
+    None for the whole file. Not with compiled
+    @param sorter a Sorter, or None. Entries are given to it, not 
+    written
+    """
+    start = time.perf_counter()
+    pipeline = None if pipelineDepth is None else Pipeline(pipelineDepth)
+    outs = [(target, openOutput(outPath, bufferSize, compressThread)) for target, outPath in targetPaths]
+    if pipeline is not None:
+        outs = [(target, pipeline.output(targetName(target), fOut)) for target, fOut in outs]
+    # repeats are dropped on this thread, so messages keep their order
+    outs = wrapOutputs(outs, targetPaths, sorter, dedup)
+    try:
+        context = Context(inPath, outs, stats=stats, diagnostics=diagnostics, pardefs=pardefs, check=check)
+        if compiled:
+            processCompiled(context, annotate, parserClass)
+        else:
+            if chunk is None:
+                fIn = openInput(inPath)
+                chunk = Chunk(0, None, 0, None)
+            else:
+                fIn = openChunk(inPath, chunk)
+            with fIn:
+                lines = fIn if pipeline is None else pipeline.lines(fIn)
+                try:
+                    if cache is None:
+                        processLines(lines, context, annotate, parserClass, chunk.startLineNum, chunk.stanzaName)
+                    else:
+                        processLinesCached(lines, context, annotate, parserClass, cache, chunk.startLineNum, chunk.stanzaName)
+                finally:
+                    if pipeline is not None:
+                        pipeline.stopReading()
+    finally:
+        try:
+            closeOutputs([fOut for _, fOut in outs])
+        finally:
+            if pipeline is not None:
+                pipeline.close(stats)
+    if stats is not None:
+        stats.elapsed += time.perf_counter() - start
+
+
+# A byte range of a file, with the context to process it alone.
+# 'startLineNum' is the number of the line before the chunk, 
+# 'stanzaName' the stanza in force at the start of the chunk, or None.
+Chunk = namedtuple('Chunk', [
+    'start',
+    'end',
+    'startLineNum',
+    'stanzaName'
+])
+
+
+def _textLines(bLine):
+    # a binary line, split as universal newlines would split it
+    return bLine.splitlines() if b'\r' in bLine else (bLine,)
+    
+    
+def scanChunks(inPath, chunkSize):
+    """
+    Split a file into chunks, cut at line ends.
+    The file is scanned for stanza headers, so each chunk carries 
+    the stanza in force where it starts. Files which can not be 
+    split by byte (no '\\n' byte in the encoding) are one chunk.
+    @return a list of Chunk
+    """
+    size = os.path.getsize(inPath)
+    with open(inPath, 'r') as f:
+        encoding = f.encoding
+    if (size <= chunkSize or '\n'.encode(encoding) != b'\n'):
+        return [Chunk(0, size, 0, None)]
+        
+    chunks = []
+    start = 0
+    startLineNum = 0
+    startStanzaName = None
+    offset = 0
+    lineNum = 0
+    stanzaName = None
+    with open(inPath, 'rb') as f:
+        for bLine in f:
+            if (offset - start >= chunkSize):
+                chunks.append(Chunk(start, offset, startLineNum, startStanzaName))
+                start = offset
+                startLineNum = lineNum
+                startStanzaName = stanzaName
+            offset += len(bLine)
+            for bTextLine in _textLines(bLine):
+                lineNum += 1
+                if b'=' in bTextLine:
+                    line = bTextLine.decode(encoding).strip()
+                    if line and line[0] == '=':
+                        stanzaName = suffix(line, '=').strip().lower()
+    chunks.append(Chunk(start, offset, startLineNum, startStanzaName))
+    return chunks
+
+
+class _BoundedReader(io.RawIOBase):
+    # a binary file which ends after a count of bytes
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+        
+    def readable(self):
+        return True
+        
+    def readinto(self, b):
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(b)
+        n = self.f.readinto(view[:min(len(view), self.remaining)])
+        if n:
+            self.remaining -= n
+        return n
+
+    def close(self):
+        try:
+            self.f.close()
+        finally:
+            super().close()
+
+
+def openChunk(inPath, chunk):
+    """
+    Open a Chunk of an input file as text, decoded as open() would.
+    The bytes are streamed from the file, not read whole, so memory
+    does not grow with the chunk size.
+    """
+    f = open(inPath, 'rb', buffering=0)
+    try:
+        f.seek(chunk.start)
+    except BaseException:
+        f.close()
+        raise
+    return io.TextIOWrapper(io.BufferedReader(
+        _BoundedReader(f, chunk.end - chunk.start),
+        outputBufferSize
+        ))
+
+
+def renderFile(
+    inPath,
+    targets,
+    annotate,
+    parserClass=Parser,
+    *,
+    chunk=None,
+    withStats=False,
+    cache=None,
+    compiled=False,
+    pardefs=None,
+    check=False
+    ):
+    """
+    Process a file, or a chunk of a file, to strings.
+    Used by worker processes. Diagnostics are captured, not printed.
+    Parameters after parserClass are keyword-only.
+    @param targets list of Target
+    @param chunk a Chunk, or None for the whole file
+    @param withStats if True, count into a Stats
+    @param cache a BuildCache, or None
+    @param compiled if True, render the whole file from its compiled
+    file. chunk must be None
+    @param pardefs a set of paradigm names to check against, or None
+    @param check if True, entries are checked by checkEntry()
+    @return (list of rendered text, one per target; list of Diagnostic;
+    a Stats or None)
+    """
+    start = time.perf_counter()
+    outs = [(target, io.StringIO()) for target in targets]
+    diagnostics = _DiagnosticList()
+    stats = Stats(inPath) if withStats else None
+    context = Context(inPath, outs, stats=stats, diagnostics=diagnostics, pardefs=pardefs, check=check)
+    if compiled:
+        processCompiled(context, annotate, parserClass)
+    else:
+        if chunk is None:
+            fIn = openInput(inPath)
+            chunk = Chunk(0, None, 0, None)
+        else:
+            fIn = openChunk(inPath, chunk)
+        with fIn:
+            if cache is None:
+                processLines(
+                    fIn,
+                    context,
+                    annotate,
+                    parserClass,
+                    chunk.startLineNum,
+                    chunk.stanzaName
+                    )
+            else:
+                processLinesCached(
+                    fIn,
+                    context,
+                    annotate,
+                    parserClass,
+                    cache,
+                    chunk.startLineNum,
+                    chunk.stanzaName
+                    )
+    if stats is not None:
+        stats.elapsed = time.perf_counter() - start
+    return [fOut.getvalue() for _, fOut in outs], list(diagnostics), stats
+
+
+def _renderFileJob(job):
+    # one-argument form of renderFile, for executors. job is a dict
+    # of its arguments
+    return renderFile(**job)
+
+
+def orderedMap(executor, fn, items, window):
+    """
+    Like executor.map(), but only `window` items are in flight. 
+    Results are yielded in the order of items.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def processTargetsParallel(
+    inPaths,
+    targetPaths,
+    annotate,
+    parserClass,
+    *,
+    jobs,
+    chunkSize,
+    bufferSize=outputBufferSize,
+    withStats=False,
+    diagnostics=None,
+    cache=None,
+    compiled=False,
+    dedup=None,
+    pardefs=None,
+    compressThread=False,
+    check=False,
+    sorter=None
+    ):
+    """
+    Process files in worker processes.
+    Files larger than chunkSize are split into chunks, processed 
+    in parallel. Rendered text and diagnostics are written in input
+    order, so output is the same as a serial run.
+    Parameters after parserClass are keyword-only.
+    @param targetPaths list of (Target, outPath). Output is appended. 
+    @param jobs number of worker processes
+    @param chunkSize in bytes
+    @param bufferSize output is written to disk in blocks of this size
+    @param withStats if True, gather Stats
+    @param diagnostics a Diagnostics, or None to print messages
+    @param cache a BuildCache, or None
+    @param compiled if True, render from compiled files. Files are
+    not split.
+    @param dedup a Dedup, or None. Repeats are dropped as results
+    are written, so the output is the same as a serial run.
+    @param pardefs a set of paradigm names to check against, or None
+    @param compressThread if True, compressed outputs are compressed
+    on threads
+    @param check if True, entries are checked by checkEntry()
+    @param sorter a Sorter, or None. Entries are given to it, not 
+    written
+    @return a list of Stats, one per input file, if withStats, or []
+    """
+    targets = [target for target, _ in targetPaths]
+    fOuts = [openOutput(outPath, bufferSize, compressThread) for _, outPath in targetPaths]
+    fOuts = [fOut for _, fOut in wrapOutputs(list(zip(targets, fOuts)), targetPaths, sorter, dedup)]
+    work = (
+        dict(
+            inPath=inPath,
+            targets=targets,
+            annotate=annotate,
+            parserClass=parserClass,
+            chunk=chunk,
+            withStats=withStats,
+            cache=cache,
+            compiled=compiled,
+            pardefs=pardefs,
+            check=check
+            )
+        for inPath in inPaths
+        # compressed files can not be split by byte
+        for chunk in ([None] if compiled or compressorFor(inPath) else scanChunks(inPath, chunkSize))
+        )
+    if diagnostics is None:
+        diagnostics = Diagnostics()
+    fileStats = []
+    try:
+        with ProcessPoolExecutor(jobs) as executor:
+            for texts, ds, stats in orderedMap(executor, _renderFileJob, work, jobs * 2):
+                diagnostics.extend(ds)
+                for fOut, text in zip(fOuts, texts):
+                    fOut.write(text)
+                if stats is not None:
+                    # chunks of a file add to one Stats
+                    if fileStats and fileStats[-1].name == stats.name:
+                        fileStats[-1].add(stats)
+                    else:
+                        fileStats.append(stats)
+    finally:
+        diagnostics.flush()
+        closeOutputs(fOuts)
+    return fileStats
+
+
+# Tables for --db. An entry row is a stanza header (kind 0) or a 
+# data line (kind 1). Pairs are the marks of a data line, side 0 for
+# source, 1 for destination. 'mark' is as parsed, 'lemma' is the 
+# stripped mark, for lookups. Paradigms are stripped.
+dbSchema = """
+CREATE TABLE IF NOT EXISTS source (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS entry (
+    id INTEGER PRIMARY KEY,
+    source INTEGER,
+    lineNum INTEGER,
+    kind INTEGER,
+    stanza TEXT,
+    stanzaParadigm TEXT
+);
+CREATE TABLE IF NOT EXISTS pair (
+    entry INTEGER,
+    side INTEGER,
+    position INTEGER,
+    mark TEXT,
+    lemma TEXT,
+    paradigm TEXT,
+    PRIMARY KEY (entry, side, position)
+) WITHOUT ROWID;
+"""
+
+# made after loading, as bulk inserts are faster without them
+dbIndexes = """
+CREATE INDEX IF NOT EXISTS entryLine ON entry (source, lineNum);
+CREATE INDEX IF NOT EXISTS entryStanza ON entry (stanza);
+CREATE INDEX IF NOT EXISTS pairLemma ON pair (side, lemma);
+CREATE INDEX IF NOT EXISTS pairParadigm ON pair (paradigm);
+"""
+
+
+def openDb(dbPath):
+    conn = sqlite3.connect(dbPath)
+    conn.executescript(dbSchema)
+    return conn
+
+
+def loadDb(conn, inPath, parserClass=Parser, diagnostics=None, batchSize=10000):
+    """
+    Parse a file into a database. Rows from an earlier load of the
+    same path are replaced. The file is loaded in one transaction, 
+    by bulk inserts of batchSize entries.
+    @param conn from openDb()
+    @param diagnostics a Diagnostics, or None to print messages
+    @return count of data lines loaded
+    """
+    count = 0
+    with conn:
+        cur = conn.cursor()
+        row = cur.execute('SELECT id FROM source WHERE path = ?', (inPath,)).fetchone()
+        if row is None:
+            sourceId = cur.execute('INSERT INTO source (path) VALUES (?)', (inPath,)).lastrowid
+        else:
+            # keep the id, so the source keeps its place in exports
+            sourceId = row[0]
+            cur.execute('DELETE FROM pair WHERE entry IN (SELECT id FROM entry WHERE source = ?)', (sourceId,))
+            cur.execute('DELETE FROM entry WHERE source = ?', (sourceId,))
+        entryId = cur.execute('SELECT COALESCE(MAX(id), 0) FROM entry').fetchone()[0]
+        entryRows = []
+        pairRows = []
+        context = Context(inPath, diagnostics=diagnostics)
+        with openInput(inPath) as fIn:
+            for e in iterEntries(fIn, parserClass, headers=True, context=context):
+                entryId += 1
+                if (type(e) is StanzaHeader):
+                    entryRows.append((entryId, sourceId, e.lineNum, 0, e.name, e.stanza.baseParadigm))
+                else:
+                    entryRows.append((entryId, sourceId, e.lineNum, 1, e.stanzaName, e.stanza.baseParadigm))
+                    for side, pairs in ((0, e.src), (1, e.dst)):
+                        for position, pair in enumerate(pairs):
+                            pairRows.append((entryId, side, position, pair.mark, pair.mark.strip(), pair.paradigm.strip()))
+                    count += 1
+                if len(entryRows) >= batchSize:
+                    cur.executemany('INSERT INTO entry VALUES (?, ?, ?, ?, ?, ?)', entryRows)
+                    cur.executemany('INSERT INTO pair VALUES (?, ?, ?, ?, ?, ?)', pairRows)
+                    entryRows = []
+                    pairRows = []
+        cur.executemany('INSERT INTO entry VALUES (?, ?, ?, ?, ?, ?)', entryRows)
+        cur.executemany('INSERT INTO pair VALUES (?, ?, ?, ?, ?, ?)', pairRows)
+    conn.executescript(dbIndexes)
+    return count
+
+
+def iterDbRecords(conn, where='', params=(), headers=False):
+    """
+    Read entries from a database, in source and line order.
+    @param where SQL condition on the entry table, as 'e'
+    @param headers if True, also yield StanzaHeader records
+    @return a generator of (source path, Entry or StanzaHeader)
+    """
+    new = _newTuple
+    kinds = '' if headers else 'e.kind = 1'
+    condition = ' AND '.join(c for c in (kinds, where) if c)
+    rows = conn.execute(
+        'SELECT e.id, s.path, e.lineNum, e.kind, e.stanza, e.stanzaParadigm, p.side, p.mark, p.paradigm'
+        ' FROM entry e JOIN source s ON s.id = e.source'
+        ' LEFT JOIN pair p ON p.entry = e.id'
+        + (' WHERE ' + condition if condition else '') +
+        ' ORDER BY s.id, e.lineNum, p.side, p.position',
+        params
+        )
+    for _, group in groupby(rows, lambda row: row[0]):
+        first = next(group)
+        _, path, lineNum, kind, stanzaName, stanzaParadigm = first[:6]
+        stanza = Stanza(stanzaParadigm)
+        if kind == 0:
+            yield path, StanzaHeader(stanzaName, stanza, lineNum)
+        else:
+            src = []
+            dst = []
+            for row in (first,) + tuple(group):
+                (dst if row[6] else src).append(new(MarkParadigmPair, (row[7], row[8])))
+            yield path, new(Entry, (stanzaName, stanza, src, dst, lineNum))
+
+
+def lookupDb(conn, srcLemma=None, dstLemma=None, paradigm=None, stanzaName=None):
+    """
+    Find entries by indexed fields. Given fields must all match.
+    @return a generator of (source path, Entry)
+    """
+    conditions = []
+    params = []
+    if srcLemma is not None:
+        conditions.append('e.id IN (SELECT entry FROM pair WHERE side = 0 AND lemma = ?)')
+        params.append(srcLemma)
+    if dstLemma is not None:
+        conditions.append('e.id IN (SELECT entry FROM pair WHERE side = 1 AND lemma = ?)')
+        params.append(dstLemma)
+    if paradigm is not None:
+        conditions.append('e.id IN (SELECT entry FROM pair WHERE paradigm = ?)')
+        params.append(paradigm)
+    if stanzaName is not None:
+        conditions.append('e.stanza = ?')
+        params.append(stanzaName.lower())
+    return iterDbRecords(conn, ' AND '.join(conditions), params)
+
+
+def skeletonSide(pairs):
+    """
+    @return pairs in skeleton text, e.g. '.tatty :adj'
+    """
+    b = []
+    for mark, paradigm in pairs:
+        b.append('.' + mark.strip() + (' :' + paradigm if paradigm else ''))
+    return b[0] if len(b) == 1 else '{' + ' '.join(b) + '}'
+
+
+def exportDb(conn, targetPaths, annotate, bufferSize=outputBufferSize, dedup=None, compressThread=False, sorter=None):
+    """
+    Render every entry in a database to the targets. Rows are 
+    streamed, so memory use does not grow with the database.
+    @param targetPaths list of (Target, outPath). Output is appended. 
+    @param dedup a Dedup, or None
+    @param compressThread if True, compressed outputs are compressed
+    on threads
+    @param sorter a Sorter, or None. Entries are given to it, not 
+    written
+    """
+    outs = [(target, openOutput(outPath, bufferSize, compressThread)) for target, outPath in targetPaths]
+    outs = wrapOutputs(outs, targetPaths, sorter, dedup)
+    try:
+        records = iterDbRecords(conn, headers=annotate)
+        for path, group in groupby(records, lambda r: r[0]):
+            context = Context(path, outs)
+            renderRecords((e for _, e in group), context, annotate)
+    finally:
+        closeOutputs([fOut for _, fOut in outs])
+
+
+# attributes of <e> which do not change its meaning, so are not
+# part of a merge key (author, comment)
+mergeIgnoredAttributes = ('a', 'c')
+
+
+def _attributesText(attrs):
+    if not attrs:
+        return ''
+    return ''.join(
+        ' {0}="{1}"'.format(k, attrs[k]) for k in sorted(attrs) 
+        if k not in mergeIgnoredAttributes
+        )
+
+
+class EntryScanner():
+    """
+    Reads <e> elements with expat, in constant memory, and gives
+    each a key. A key is a digest of the tags, attributes and text
+    of the element, so layout and attribute order do not matter.
+    Given a section id, also finds the place to insert entries at
+    the end of that section.
+    """
+    def __init__(self, entryDepth, sectionId=None):
+        """
+        @param entryDepth element depth of the <e> elements to key,
+        1 for the root. Entries in a .dix section are at 3.
+        @param sectionId id of a <section>, or None
+        """
+        self.entryDepth = entryDepth
+        self.sectionId = sectionId
+        self.depth = 0
+        # parts of the key of an open <e>, or None
+        self.parts = None
+        # text since the last tag. Gathered, as expat can split text
+        self.text = []
+        self.keys = set()
+        self.lastKey = None
+        self.inSection = False
+        # byte offsets of the section start tag, and end tag, or None.
+        # For an empty element, '<section/>', the end is after '/>'
+        self.sectionStart = None
+        self.sectionEnd = None
+        # True if the section has elements or text. If not, it may be
+        # an empty element
+        self.sectionContent = False
+        # whitespace before the first entry, the end tag, and the 
+        # start tag
+        self.entryIndent = None
+        self.endSpace = ''
+        self.sectionSpace = ''
+        p = expat.ParserCreate()
+        p.StartElementHandler = self.start
+        p.EndElementHandler = self.end
+        p.CharacterDataHandler = self.text.append
+        p.CommentHandler = self.comment
+        p.buffer_text = True
+        self.parser = p
+        
+    def _takeText(self):
+        text = ''.join(self.text)
+        # cleared in place, as the parser holds append()
+        self.text.clear()
+        return text
+
+    def start(self, name, attrs):
+        parts = self.parts
+        text = self._takeText() if self.text else ''
+        self.depth += 1
+        if self.inSection:
+            self.sectionContent = True
+        if parts is not None:
+            text = text.strip()
+            if text:
+                parts.append(text)
+            parts.append('<' + name + _attributesText(attrs) + '>')
+        elif name == 'e' and self.depth == self.entryDepth:
+            if self.inSection and self.entryIndent is None:
+                self.entryIndent = text
+            self.parts = ['<e' + _attributesText(attrs) + '>']
+        elif name == 'section' and self.depth == 2 and attrs.get('id') == self.sectionId:
+            self.inSection = True
+            self.sectionStart = self.parser.CurrentByteIndex
+            self.sectionSpace = text
+            
+    def end(self, name):
+        parts = self.parts
+        text = self._takeText() if self.text else ''
+        if parts is not None:
+            text = text.strip()
+            if text:
+                parts.append(text)
+            parts.append('</' + name + '>')
+            if self.depth == self.entryDepth:
+                key = hashlib.blake2b(
+                    ''.join(parts).encode('utf-8', 'surrogateescape'),
+                    digest_size=16
+                    ).digest()
+                self.keys.add(key)
+                self.lastKey = key
+                self.parts = None
+        elif self.inSection and self.depth == 2:
+            self.sectionEnd = self.parser.CurrentByteIndex
+            self.endSpace = text
+            if text.strip():
+                self.sectionContent = True
+            self.inSection = False
+        self.depth -= 1
+        
+    def comment(self, data):
+        if self.parts is None:
+            self.text.clear()
+
+
+def mergeDix(dixPath, entryPath, outPath, sectionId='main'):
+    """
+    Merge generated entries into a dictionary.
+    The dictionary is streamed twice. First with expat, for the keys
+    of its entries, and the end of the section. Then it is copied as 
+    bytes, with new entries inserted at the end of the section. 
+    Entries already in the dictionary, or repeated, are skipped. An
+    empty section, '<section .../>', is written as start and end 
+    tags around the new entries. The result is written aside, then 
+    renamed to outPath.
+    @param entryPath generated entries, one per line
+    @param sectionId id of the <section> to add to
+    @return (count added, count skipped)
+    @raise ValueError if the dictionary, or a generated entry, is 
+    not well-formed XML, or the section is not found
+    """
+    scanner = EntryScanner(3, sectionId)
+    with open(dixPath, 'rb') as f:
+        try:
+            scanner.parser.ParseFile(f)
+        except expat.ExpatError as e:
+            raise ValueError('{0}: {1}'.format(dixPath, e))
+    if scanner.sectionEnd is None:
+        raise ValueError('{0}: no section with id \'{1}\''.format(dixPath, sectionId))
+    existing = scanner.keys
+    emptySection = False
+    if not scanner.sectionContent:
+        with open(dixPath, 'rb') as f:
+            f.seek(scanner.sectionStart)
+            tag = f.read(scanner.sectionEnd - scanner.sectionStart)
+        emptySection = tag.endswith(b'/>')
+    if emptySection:
+        # the indent of the start tag serves for the end tag
+        scanner.endSpace = scanner.sectionSpace
+    
+    # keys of generated entries, one line at a time
+    lineScanner = EntryScanner(2)
+    lineScanner.parser.Parse(b'<entries>')
+    nl = '\r\n' if '\r\n' in scanner.endSpace else '\n'
+    endIndent = scanner.endSpace.rpartition('\n')[2]
+    indent = scanner.entryIndent.rpartition('\n')[2] if scanner.entryIndent is not None else endIndent + '  '
+    added = []
+    skipped = 0
+    with open(entryPath, 'r') as fIn:
+        for lineNum, line in enumerate(fIn, 1):
+            if not line.startswith('<e'):
+                continue
+            # e.g. a mark with '&' makes an entry which is not XML
+            try:
+                lineScanner.parser.Parse(line.encode('utf-8', 'surrogateescape'))
+            except expat.ExpatError as e:
+                raise ValueError('{0}:{1}: {2}: {3}'.format(
+                    entryPath,
+                    lineNum,
+                    expat.ErrorString(e.code),
+                    line.strip()
+                    ))
+            key = lineScanner.lastKey
+            if key in existing:
+                skipped += 1
+            else:
+                existing.add(key)
+                added.append(indent + line.rstrip('\r\n') + nl)
+    try:
+        lineScanner.parser.Parse(b'</entries>', True)
+    except expat.ExpatError as e:
+        raise ValueError('{0}: {1}'.format(entryPath, e))
+    
+    # insert on the line of the end tag, before its indent
+    insertAt = scanner.sectionEnd
+    skip = 0
+    if emptySection and added:
+        # '/>' is replaced
+        insertAt -= 2
+        skip = 2
+        insert = '>' + nl + ''.join(added) + endIndent + '</section>'
+    elif '\n' in scanner.endSpace:
+        insertAt -= len(endIndent.encode('utf-8'))
+        insert = ''.join(added)
+    else:
+        insert = nl + ''.join(added)
+    tmpPath = outPath + '.tmp'
+    with open(dixPath, 'rb') as fIn, open(tmpPath, 'wb') as fOut:
+        remaining = insertAt
+        while remaining:
+            b = fIn.read(min(remaining, outputBufferSize))
+            if not b:
+                break
+            fOut.write(b)
+            remaining -= len(b)
+        fIn.read(skip)
+        fOut.write(insert.encode('utf-8', 'surrogateescape'))
+        shutil.copyfileobj(fIn, fOut, outputBufferSize)
+    os.replace(tmpPath, outPath)
+    return len(added), skipped
+
+
+def processLemmas(inPath, outPath, dictionaryType, annotate, parserClass=Parser):
+    """
+    Process a file, stepping by line, to a lemma list.
+    """
+    print(outPath)
+    processTargets(inPath, [(Target(dictionaryType, True), outPath)], annotate, parserClass)
+
+
+def process(inPath, outPath, dictionaryType, annotate, parserClass=Parser):
+    """
+    Process a file, stepping by line.
+    """
+    processTargets(inPath, [(Target(dictionaryType, False), outPath)], annotate, parserClass)
+    
+def _silentRemove(entryPath):
+    try:
+        os.remove(entryPath)
+    except OSError:
+        pass
+    
+def _tmpPath(oPath):
+    # where an output is written before it is renamed into place. 
+    # Keeps a compressed extension, so is compressed the same
+    root, ext = os.path.splitext(oPath)
+    if ext in compressors:
+        return root + '.tmp' + ext
+    return oPath + '.tmp'
+    
+def _finalPath(path):
+    # the output a _tmpPath() is for, or path
+    root, ext = os.path.splitext(path)
+    if ext in compressors:
+        return root[:-4] + ext if root.endswith('.tmp') else path
+    return path[:-4] if ext == '.tmp' else path
+    
+def outputEntryPath(outputBasenamePath, basename, tpe):
+    return os.path.join(outputBasenamePath, basename + '-' + tpe + '.parDix')
+
+def optsTargetPaths(opts):
+    """
+    @return list of (Target, outPath) for the options
+    """
+    if opts.stdout:
+        # checked to be one target
+        return [(Target(opts.type, opts.lemmaFile), streamPath)]
+    targetPaths = []
+    compressExtension = '.' + opts.compress if opts.compress else ''
+    if (opts.lemmaFile or opts.withLemmaFile):
+        o = os.path.join(opts.outputBasenamePath,  opts.outputBasename + '-lemmas' + compressExtension)
+        targetPaths.append((Target(opts.type, True), o))
+        if (not opts.quiet): print(o)
+
+    if (not opts.lemmaFile):
+        # 'a' is all dictionaries, from one parse
+        tpes = ['s', 'd', 'bi'] if (opts.type == 'a') else [opts.type]
+        for tpe in tpes:
+            oPath = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, tpe) + compressExtension
+            targetPaths.append((Target(tpe, False), oPath))
+    return targetPaths
+
+
+def optsDiagnosticsBatchSize(opts):
+    return 1 if streamPath in opts.infiles else diagnosticsBatchSize
+
+
+def optsDedup(opts, diagnostics):
+    """
+    @return a Dedup for the options, or None
+    """
+    if not opts.dedup:
+        return None
+    memoryBytes = None if opts.dedupMemory is None else opts.dedupMemory * 1024 * 1024
+    return Dedup(diagnostics, memoryBytes, opts.outputBasenamePath)
+
+
+def optsSorter(opts):
+    """
+    @return a Sorter for the options, or None
+    """
+    if not opts.sort:
+        return None
+    return Sorter(
+        opts.sortMemory * 1024 * 1024,
+        opts.outputBasenamePath,
+        opts.unique,
+        opts.annotate
+        )
+
+
+class Checkpoint():
+    """
+    Progress of a run, for --checkpoint. Input files are processed in
+    chunks, and after each, a JSON file records where the next chunk
+    starts: input file index, byte offset, line number and stanza,
+    and the size of each output. A later run over the same inputs 
+    and outputs truncates the outputs to those sizes, and goes on 
+    from there.
+    Compressed inputs can not be split, so are resumed from their 
+    start.
+    """
+    def __init__(self, path, inPaths, targetPaths, annotate, chunkSize=checkpointSize):
+        """
+        @param targetPaths list of (Target, outPath). The outputs 
+        must be kept between runs, so are temporary files, not 
+        the targets
+        """
+        self.path = path
+        self.targetPaths = targetPaths
+        self.chunkSize = chunkSize
+        self.key = {
+            'version': checkpointVersion,
+            'inputs': [[inPath] + list(_inputState([inPath])[0] or ()) for inPath in inPaths],
+            'outputs': [outPath for _, outPath in targetPaths],
+            'annotate': annotate,
+            'stanzas': sorted((k, v.baseParadigm) for k, v in stanzas.items())
+        }
+        self.fileIndex = 0
+        self.offset = 0
+        self.lineNum = 0
+        self.stanzaName = None
+        
+    def load(self):
+        """
+        Read the checkpoint file, if it is for this run, and truncate
+        the outputs to its sizes.
+        @return True if the run can resume
+        """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('key') != json.loads(json.dumps(self.key)):
+            return False
+        sizes = data['sizes']
+        for (_, outPath), size in zip(self.targetPaths, sizes):
+            try:
+                if os.path.getsize(outPath) < size:
+                    return False
+            except OSError:
+                return False
+        for (_, outPath), size in zip(self.targetPaths, sizes):
+            os.truncate(outPath, size)
+        self.chunkSize = data['chunkSize']
+        self.fileIndex = data['fileIndex']
+        self.offset = data['offset']
+        self.lineNum = data['lineNum']
+        self.stanzaName = data['stanzaName']
+        return True
+        
+    def chunks(self, fileIndex, inPath):
+        """
+        @return the chunks of an input still to process, Chunk or 
+        None for the whole file
+        """
+        if fileIndex < self.fileIndex:
+            return []
+        if compressorFor(inPath):
+            return [None]
+        chunks = scanChunks(inPath, self.chunkSize)
+        if fileIndex == self.fileIndex:
+            chunks = [chunk for chunk in chunks if chunk.start >= self.offset]
+        return chunks
+        
+    def save(self, fileIndex, nextChunk):
+        """
+        Record that the run reached a chunk.
+        @param nextChunk the next Chunk of the file fileIndex, or None
+        if the file is done
+        """
+        if nextChunk is None:
+            self.fileIndex = fileIndex + 1
+            self.offset = 0
+            self.lineNum = 0
+            self.stanzaName = None
+        else:
+            self.fileIndex = fileIndex
+            self.offset = nextChunk.start
+            self.lineNum = nextChunk.startLineNum
+            self.stanzaName = nextChunk.stanzaName
+        data = {
+            'key': self.key,
+            'chunkSize': self.chunkSize,
+            'fileIndex': self.fileIndex,
+            'offset': self.offset,
+            'lineNum': self.lineNum,
+            'stanzaName': self.stanzaName,
+            'sizes': [os.path.getsize(outPath) for _, outPath in self.targetPaths]
+        }
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmpPath, self.path)
+        
+    def remove(self):
+        _silentRemove(self.path)
+
+
+def build(opts, targetPaths, cache=None, checkpoint=None):
+    """
+    Process the input files to the targets, then report stats.
+    Output is appended to the target paths. With opts.check, entries
+    are also checked by checkEntry().
+    @param cache a BuildCache, or None
+    @param checkpoint a Checkpoint, or None. Files are processed from
+    where it stands, and it is saved after each chunk. Not with -j
+    @return {severity: count} of the messages, or None if the build
+    could not start
+    """
+    pardefs = None
+    if opts.checkPardefs:
+        try:
+            pardefs = readPardefs(opts.checkPardefs, cache)
+        except ValueError as e:
+            printError('--checkPardefs: {0}'.format(e))
+            return
+        except OSError as e:
+            printError('--checkPardefs: {0}: {1}'.format(opts.checkPardefs, e.strerror))
+            return
+    parserClass = parsers[opts.parser]
+    withStats = opts.stats or bool(opts.statsFile)
+    # opened first, so a bad path fails before outputs are made
+    statsOut = None
+    if opts.statsFile:
+        try:
+            statsOut = open(opts.statsFile, 'w')
+        except OSError as e:
+            printError('--statsFile: {0}: {1}'.format(opts.statsFile, e.strerror))
+            return
+    jsonOut = None
+    if opts.diagnosticsFile:
+        try:
+            jsonOut = open(opts.diagnosticsFile, 'w')
+        except OSError as e:
+            printError('--diagnosticsFile: {0}: {1}'.format(opts.diagnosticsFile, e.strerror))
+            if statsOut is not None:
+                statsOut.close()
+            return
+    diagnostics = Diagnostics(
+        sys.stderr if opts.diagnosticsStderr else None,
+        jsonOut,
+        opts.quiet,
+        opts.maxPerCode,
+        optsDiagnosticsBatchSize(opts)
+        )
+    dedup = optsDedup(opts, diagnostics)
+    sorter = optsSorter(opts)
+    start = time.perf_counter()
+    try:
+        if (opts.jobs > 1):
+            fileStats = processTargetsParallel(
+                opts.infiles,
+                targetPaths,
+                opts.annotate,
+                parserClass,
+                jobs=opts.jobs,
+                chunkSize=opts.chunkSize,
+                bufferSize=opts.bufferSize,
+                withStats=withStats,
+                diagnostics=diagnostics,
+                cache=cache,
+                compiled=opts.compile,
+                dedup=dedup,
+                pardefs=pardefs,
+                compressThread=opts.compressThread,
+                check=opts.check,
+                sorter=sorter
+                )
+        else:
+            fileStats = []
+            for fileIndex, inPath in enumerate(opts.infiles):
+                chunks = [None] if checkpoint is None else checkpoint.chunks(fileIndex, inPath)
+                if not chunks:
+                    continue
+                stats = Stats(inPath) if withStats else None
+                for i, chunk in enumerate(chunks):
+                    processTargets(
+                        inPath,
+                        targetPaths,
+                        opts.annotate,
+                        parserClass,
+                        bufferSize=opts.bufferSize,
+                        stats=stats,
+                        diagnostics=diagnostics,
+                        cache=cache,
+                        compiled=opts.compile,
+                        dedup=dedup,
+                        pardefs=pardefs,
+                        compressThread=opts.compressThread,
+                        pipelineDepth=opts.pipelineDepth if opts.pipeline else None,
+                        check=opts.check,
+                        chunk=chunk,
+                        sorter=sorter
+                        )
+                    if checkpoint is not None:
+                        # messages are written before the checkpoint
+                        diagnostics.flush()
+                        checkpoint.save(fileIndex, chunks[i + 1] if i + 1 < len(chunks) else None)
+                if stats is not None:
+                    fileStats.append(stats)
+        if sorter is not None:
+            sorter.finish(opts.bufferSize, opts.compressThread)
+    except BaseException:
+        if statsOut is not None:
+            statsOut.close()
+        raise
+    finally:
+        diagnostics.close()
+        if jsonOut is not None:
+            jsonOut.close()
+        if dedup is not None:
+            dedup.close()
+        if sorter is not None:
+            sorter.close()
+    if cache is not None:
+        cache.evict()
+    if dedup is not None and not opts.quiet:
+        dedup.report(sys.stdout)
+
+    if withStats:
+        total = Stats('total')
+        for stats in fileStats:
+            total.add(stats)
+        # stage times are summed over files (and workers), but
+        # the total rate is over the wall time
+        total.elapsed = time.perf_counter() - start
+        if opts.stats:
+            for stats in fileStats + [total]:
+                stats.report(sys.stdout)
+        if statsOut is not None:
+            with statsOut as f:
+                json.dump({
+                    'files': [stats.asDict() for stats in fileStats],
+                    'total': total.asDict()
+                    }, f, indent=2)
+    return diagnostics.severities
+
+
+def buildAtomic(opts, targetPaths, cache=None, keepUnchanged=True):
+    """
+    As build(), but outputs are written to temporary files, then 
+    renamed over the target paths. Readers never see a part-written
+    output, and if the build fails, the targets are as they were.
+    With opts.checkpoint, the temporary files are kept on failure,
+    and a later run resumes them.
+    @param keepUnchanged if True, outputs which have not changed 
+    are left untouched
+    @return list of output paths replaced, or None if the build 
+    could not start
+    """
+    tmpPaths = [(target, _tmpPath(oPath)) for target, oPath in targetPaths]
+    checkpoint = None
+    resumed = False
+    if getattr(opts, 'checkpoint', None):
+        checkpoint = Checkpoint(
+            opts.checkpoint,
+            opts.infiles,
+            tmpPaths,
+            opts.annotate,
+            opts.checkpointSize * 1024 * 1024
+            )
+        resumed = checkpoint.load()
+        if resumed and not opts.quiet:
+            print('[checkpoint] resuming at input {0}, byte {1}, line {2}'.format(
+                opts.infiles[checkpoint.fileIndex] if checkpoint.fileIndex < len(opts.infiles) else '(end)',
+                checkpoint.offset,
+                checkpoint.lineNum
+                ))
+    if not resumed:
+        for _, tmpPath in tmpPaths:
+            _silentRemove(tmpPath)
+    try:
+        severities = build(opts, tmpPaths, cache, checkpoint)
+    except BaseException:
+        if checkpoint is None:
+            for _, tmpPath in tmpPaths:
+                _silentRemove(tmpPath)
+        raise
+    if severities is None:
+        return None
+    if checkpoint is not None:
+        checkpoint.remove()
+    written = []
+    for (_, tmpPath), (_, oPath) in zip(tmpPaths, targetPaths):
+        if not os.path.exists(tmpPath):
+            continue
+        if keepUnchanged and os.path.exists(oPath) and filecmp.cmp(tmpPath, oPath, shallow=False):
+            _silentRemove(tmpPath)
+        else:
+            os.replace(tmpPath, oPath)
+            written.append(oPath)
+    return written
+
+
+def _inputState(inPaths):
+    # (mtime, size) of each path, None if missing
+    b = []
+    for inPath in inPaths:
+        try:
+            st = os.stat(inPath)
+            b.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            b.append(None)
+    return b
+
+
+def watch(opts, targetPaths, cache=None):
+    """
+    Poll the input files, and rebuild the outputs when any changes.
+    Every output is made from every input file, so a change rebuilds
+    all targets. But with a cache, only changed blocks of input are 
+    parsed. If a rebuild fails, the error is printed, and the watch
+    goes on. Returns on KeyboardInterrupt.
+    @param cache a BuildCache, or None to cache in memory
+    """
+    if cache is None and opts.jobs == 1:
+        cache = MemoryCache()
+    lastState = None
+    try:
+        while True:
+            state = _inputState(opts.infiles)
+            if state != lastState:
+                missing = [p for p, st in zip(opts.infiles, state) if st is None]
+                if missing:
+                    # often mid-save. Wait for the file to return
+                    if lastState is None or None not in lastState:
+                        printWarning('watch: input missing: {0}'.format(', '.join(missing)))
+                else:
+                    changed = opts.infiles if lastState is None else [
+                        p for p, st, lastSt in zip(opts.infiles, state, lastState)
+                        if st != lastSt
+                        ]
+                    start = time.perf_counter()
+                    # a failed build leaves the outputs as they were, 
+                    # and the watch waits for the next change
+                    try:
+                        written = buildAtomic(opts, targetPaths, cache)
+                    except Exception as e:
+                        printError('watch: rebuild failed, changed: {0}: {1}: {2}'.format(
+                            ', '.join(os.path.basename(p) for p in changed),
+                            type(e).__name__,
+                            e
+                            ))
+                        written = None
+                    if written is not None:
+                        print('[watch] rebuilt in {0:.3f}s, changed: {1}, written: {2}'.format(
+                            time.perf_counter() - start,
+                            ', '.join(os.path.basename(p) for p in changed),
+                            ', '.join(os.path.basename(p) for p in written) or 'none'
+                            ))
+                    sys.stdout.flush()
+                lastState = state
+            time.sleep(opts.watchInterval)
+    except KeyboardInterrupt:
+        pass
+
+
+def processDb(opts):
+    """
+    Load input files into the --db database, look up entries, or 
+    export dictionaries from it.
+    """
+    conn = openDb(opts.db)
+    try:
+        if opts.infiles:
+            diagnostics = Diagnostics(
+                sys.stderr if opts.diagnosticsStderr else None,
+                None,
+                opts.quiet,
+                opts.maxPerCode,
+                optsDiagnosticsBatchSize(opts)
+                )
+            parserClass = parsers[opts.parser]
+            try:
+                for inPath in opts.infiles:
+                    start = time.perf_counter()
+                    count = loadDb(conn, inPath, parserClass, diagnostics)
+                    diagnostics.flush()
+                    if (not opts.quiet):
+                        print('[db] loaded {0} entries from {1} in {2:.3f}s'.format(
+                            count,
+                            inPath,
+                            time.perf_counter() - start
+                            ))
+            finally:
+                diagnostics.close()
+        if (opts.lookupSrc is not None 
+            or opts.lookupDst is not None
+            or opts.lookupParadigm is not None
+            or opts.lookupStanza is not None
+            ):
+            for path, e in lookupDb(
+                conn,
+                opts.lookupSrc,
+                opts.lookupDst,
+                opts.lookupParadigm,
+                opts.lookupStanza
+                ):
+                print('{0}:{1}: [{2}] {3} {4}'.format(
+                    path,
+                    e.lineNum,
+                    e.stanzaName,
+                    skeletonSide(e.src),
+                    skeletonSide(e.dst)
+                    ))
+        if opts.fromDb:
+            targetPaths = optsTargetPaths(opts)
+            # written aside, then renamed, as buildAtomic(). stdout 
+            # is written as made
+            tmpPaths = [(target, oPath if oPath == streamPath else _tmpPath(oPath)) for target, oPath in targetPaths]
+            for _, tmpPath in tmpPaths:
+                _silentRemove(tmpPath) 
+            dedup = optsDedup(opts, Diagnostics(quiet=opts.quiet, maxPerCode=opts.maxPerCode))
+            sorter = optsSorter(opts)
+            try:
+                exportDb(conn, tmpPaths, opts.annotate, opts.bufferSize, dedup, opts.compressThread, sorter)
+                if sorter is not None:
+                    sorter.finish(opts.bufferSize, opts.compressThread)
+            except BaseException:
+                for _, tmpPath in tmpPaths:
+                    if tmpPath != streamPath:
+                        _silentRemove(tmpPath)
+                raise
+            finally:
+                if dedup is not None:
+                    dedup.diagnostics.close()
+                    dedup.close()
+                if sorter is not None:
+                    sorter.close()
+            for (_, tmpPath), (_, oPath) in zip(tmpPaths, targetPaths):
+                if tmpPath != oPath:
+                    os.replace(tmpPath, oPath)
+            if dedup is not None and not opts.quiet:
+                dedup.report(sys.stdout)
+    finally:
+        conn.close()
+
+
+def processOpts(opts):
+    if opts.unique and not opts.sort:
+        printError('--unique needs --sort')
+        return 1
+    if opts.db and (opts.mergeInto or opts.checkpoint or opts.watch or opts.check or opts.checkPardefs):
+        printError('--db can not be used with --mergeInto, --checkpoint, --watch, --check or --checkPardefs')
+        return 1
+    if opts.mergeInto and (opts.type == 'a' or opts.lemmaFile):
+        printError('--mergeInto needs one dictionary, -t s, d or bi, and not -l')
+        return 1
+    if opts.checkPardefs and (opts.type not in ('s', 'd') or opts.lemmaFile):
+        printError('--checkPardefs needs a mono-dictionary, -t s or d, and not -l')
+        return 1
+    if opts.stdout:
+        if (opts.type == 'a' and not opts.lemmaFile) or opts.withLemmaFile:
+            printError('--stdout needs one output, -t s, d or bi, or -l, and not -L')
+            return 1
+        if opts.watch or opts.mergeInto or opts.compress:
+            printError('--stdout can not be used with --watch, --mergeInto or --compress')
+            return 1
+    if opts.compress and opts.mergeInto:
+        printError('--mergeInto can not be used with --compress')
+        return 1
+    if opts.watch and opts.mergeInto:
+        printError('--mergeInto can not be used with --watch')
+        return 1
+    if opts.mergeInto and not os.path.isfile(opts.mergeInto):
+        printError('--mergeInto: path not exists, or is not a file: {0}'.format(opts.mergeInto))
+        return 1
+    if opts.db:
+        # the checks above are on the outputs, so hold for --fromDb
+        processDb(opts)
+        return
+    if opts.checkpoint and (opts.jobs > 1 or opts.dedup or opts.compile or opts.watch or opts.stdout or opts.check or opts.sort or streamPath in opts.infiles):
+        printError("--checkpoint can not be used with -j, --dedup, --compile, --watch, --stdout, --check, --sort, or input from stdin ('-')")
+        return 1
+    if opts.pipeline and opts.jobs > 1:
+        printError('--pipeline can not be used with -j. Worker runs already parse while the outputs are written')
+        return 1
+    if streamPath in opts.infiles:
+        if opts.jobs > 1 or opts.compile or opts.watch:
+            printError("input from stdin ('-') can not be used with -j, --compile or --watch")
+            return 1
+    if opts.check:
+        if opts.watch or opts.mergeInto or opts.stdout or opts.checkPardefs:
+            printError('--check can not be used with --watch, --mergeInto, --stdout or --checkPardefs')
+            return 1
+        targetPaths = []
+    else:
+        targetPaths = optsTargetPaths(opts)
+    cache = None
+    if opts.cacheDir:
+        cache = BuildCache(opts.cacheDir, opts.cacheSize * 1024 * 1024)
+    if opts.check:
+        # no targets, so only parsed and checked
+        severities = build(opts, targetPaths, cache)
+        if severities is None:
+            return 1
+        errors = severities.get('error', 0)
+        if (not opts.quiet):
+            print('[check] {0} errors, {1} warnings, in {2} files'.format(
+                errors,
+                severities.get('warning', 0),
+                len(opts.infiles)
+                ))
+        return 1 if errors else 0
+    if opts.watch:
+        watch(opts, targetPaths, cache)
+        return
+
+    if opts.stdout:
+        build(opts, targetPaths, cache)
+    elif buildAtomic(opts, targetPaths, cache, keepUnchanged=False) is None:
+        return 1
+
+    if opts.mergeInto:
+        entryPath = outputEntryPath(opts.outputBasenamePath, opts.outputBasename, opts.type)
+        outPath = opts.mergeOutput or '{0}.merged{1}'.format(*os.path.splitext(opts.mergeInto))
+        start = time.perf_counter()
+        try:
+            added, skipped = mergeDix(opts.mergeInto, entryPath, outPath, opts.mergeSection)
+        except ValueError as e:
+            printError('merge failed: {0}'.format(e))
+            return 1
+        if (not opts.quiet):
+            print('[merge] {0} entries added, {1} already present, to {2} in {3:.3f}s'.format(
+                added,
+                skipped,
+                outPath,
+                time.perf_counter() - start
+                ))
+
+        
+def stripExtension(path):
+    #os.path.basename(path)
+    i = path.rfind('.')
+    return path[:i] if (i != -1) else path
+    
+
+# main
+
+def main(argv):
+    annotate = False
+    inPath = 'in'
+    outPath = ''
+    targetDictionary = 's'
+    
+    parser = argparse.ArgumentParser(
+        epilog= "NB: keynames in the internal 'stanza' variable must be adjusted to match input files"
+        )
+        
+    parser.add_argument("-a", "--annotate", 
+        default=False,
+        help="annotate the output with stanza information",
+        action="store_true"
+        )
+        
+    parser.add_argument("-l", "--lemmaFile",
+        default=False,
+        help="output lemmas to a file, one per line. Parses like the main parser (ignoring unknown stanza names etc.) Responds to -t, printing src/dst/all dictionary entries. Also responds to -a.",
+        action="store_true"
+        )
+        
+    parser.add_argument("-L", "--withLemmaFile",
+        default=False,
+        help="as -l, but the dictionaries are output too, from the same parse.",
+        action="store_true"
+        )
+        
+    parser.add_argument("-t", "--type",
+        choices=['s', 'd', 'bi', 'a'],
+        default='bi',
+        help="output dictionary type ('s': source monodix, 'd': destination monodix, or 'bi': bilingualdix. Default: 'bi')",
+        )
+        
+    parser.add_argument("-p", "--parser",
+        choices=sorted(parsers.keys()),
+        default='classic',
+        help="line parser. 'fast' tokenizes lines with a compiled regex (default: 'classic')"
+        )
+        
+    parser.add_argument("-j", "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes. Input files are processed in parallel, output is the same as a single process (default: 1)"
+        )
+        
+    parser.add_argument("--chunkSize",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="with -j, input files larger than this are split and processed in parallel, in bytes (default: 4MB)"
+        )
+        
+    parser.add_argument("--bufferSize",
+        type=int,
+        default=outputBufferSize,
+        help="output is written to disk in blocks of this many bytes (default: 1MB)"
+        )
+        
+    parser.add_argument("--stats",
+        default=False,
+        help="report stage timings, line counts, and entries by stanza, for each file and in total",
+        action="store_true"
+        )
+        
+    parser.add_argument("--statsFile",
+        default=None,
+        help="write the --stats data to this file, as JSON"
+        )
+        
+    parser.add_argument("-q", "--quiet",
+        default=False,
+        help="print no messages about input lines, and no startup information",
+        action="store_true"
+        )
+        
+    parser.add_argument("--maxPerCode",
+        type=int,
+        default=None,
+        help="print only this many messages of each kind, then a count of the rest"
+        )
+        
+    parser.add_argument("--diagnosticsStderr",
+        default=False,
+        help="print messages about input lines to stderr, not stdout",
+        action="store_true"
+        )
+        
+    parser.add_argument("--diagnosticsFile",
+        default=None,
+        help="write every message about input lines to this file, as JSON lines (path, lineNum, severity, code, message)"
+        )
+        
+    parser.add_argument("--cacheDir",
+        default=None,
+        help="keep rendered blocks of input in this directory. Unchanged blocks are not parsed again on later runs"
+        )
+        
+    parser.add_argument("--cacheSize",
+        type=int,
+        default=cacheSize // (1024 * 1024),
+        help="with --cacheDir, the least recently used blocks are removed above this size, in MB (default: {0})".format(cacheSize // (1024 * 1024))
+        )
+        
+    parser.add_argument("--dedup",
+        default=False,
+        help="drop entries already written to a dictionary, from any line or file, and report them. Lemma files are not changed",
+        action="store_true"
+        )
+        
+    parser.add_argument("--dedupMemory",
+        type=int,
+        default=None,
+        help="with --dedup, index entries in this many MB of memory (a Bloom filter), and check possible repeats in a temporary file. For corpora too large to index in memory"
+        )
+        
+    parser.add_argument("--sort",
+        default=False,
+        help="write entries sorted. Dictionary entries are grouped by stanza tag, then ordered by lemma, or for bi by left and right marks. Lemma files are ordered by lemma. Sorted in bounded memory, see --sortMemory",
+        action="store_true"
+        )
+        
+    parser.add_argument("--sortMemory",
+        type=int,
+        default=sortMemory // (1024 * 1024),
+        help="with --sort, MB of entries held in memory. Over this, sorted runs are written to temporary files, then merged (default: {0})".format(sortMemory // (1024 * 1024))
+        )
+        
+    parser.add_argument("--unique",
+        default=False,
+        help="with --sort, write repeated lines once",
+        action="store_true"
+        )
+        
+    parser.add_argument("--mergeInto",
+        default=None,
+        help="a .dix dictionary. Generated entries not already in it are added to the end of a section, and the result written to --mergeOutput. Needs -t s, d or bi, and not --watch"
+        )
+        
+    parser.add_argument("--mergeSection",
+        default='main',
+        help="with --mergeInto, id of the section to add to (default: 'main')"
+        )
+        
+    parser.add_argument("--mergeOutput",
+        default=None,
+        help="with --mergeInto, path of the merged dictionary (default: the dictionary path, with '.merged' before the extension)"
+        )
+        
+    parser.add_argument("--checkPardefs",
+        default=None,
+        help="a .dix dictionary. Report generated entries which use paradigms not defined in its <pardefs>. Needs -t s or d"
+        )
+        
+    parser.add_argument("--compile",
+        default=False,
+        help="keep parsed entries in a compiled file beside each input (input path + '{0}'). Later runs with --compile, for any target, load the compiled file instead of parsing, until the input changes".format(compiledExtension),
+        action="store_true"
+        )
+        
+    parser.add_argument("--db",
+        default=None,
+        help="SQLite database. Input files are loaded into it, replacing earlier loads of the same files, and no dictionaries are written. Used by the --lookup options and --fromDb"
+        )
+        
+    parser.add_argument("--lookupSrc",
+        default=None,
+        help="with --db, print entries with this source lemma"
+        )
+        
+    parser.add_argument("--lookupDst",
+        default=None,
+        help="with --db, print entries with this destination lemma"
+        )
+        
+    parser.add_argument("--lookupParadigm",
+        default=None,
+        help="with --db, print entries using this paradigm"
+        )
+        
+    parser.add_argument("--lookupStanza",
+        default=None,
+        help="with --db, print entries in this stanza"
+        )
+        
+    parser.add_argument("--fromDb",
+        default=False,
+        help="with --db, write the dictionaries chosen by -t, -l and -L from the database, not from input files",
+        action="store_true"
+        )
+        
+    parser.add_argument("--watch",
+        default=False,
+        help="keep running, and rebuild the outputs when an input file changes. Outputs are replaced whole, and only if changed",
+        action="store_true"
+        )
+        
+    parser.add_argument("--watchInterval",
+        type=float,
+        default=0.5,
+        help="with --watch, seconds between checks of the input files (default: 0.5)"
+        )
+        
+    parser.add_argument("--compress",
+        choices=['gz', 'bz2', 'xz'],
+        default=None,
+        help="compress the output files. The extension is added to their names. Inputs ending '.gz', '.bz2' or '.xz' are always decompressed"
+        )
+        
+    parser.add_argument("--compressThread",
+        default=False,
+        help="with --compress, compress each output on a thread, while parsing goes on",
+        action="store_true"
+        )
+        
+    parser.add_argument("--pipeline",
+        default=False,
+        help="read the input, and write each output, on threads, so parsing does not wait on disk. Not with -j",
+        action="store_true"
+        )
+        
+    parser.add_argument("--pipelineDepth",
+        type=int,
+        default=pipelineDepth,
+        help="with --pipeline, batches held between threads. When a queue is full, the stage before waits (default: {0})".format(pipelineDepth)
+        )
+        
+    parser.add_argument("--check",
+        default=False,
+        help="only parse and check the input files, writing nothing. Also reports empty marks, and slashed paradigms longer than their mark. Exits with status 1 if there are errors",
+        action="store_true"
+        )
+        
+    parser.add_argument("--checkpoint",
+        default=None,
+        help="a file to save progress in. Input is processed in parts, and after each, progress is saved. If the run stops, the same command resumes it. Removed when the run completes",
+        )
+        
+    parser.add_argument("--checkpointSize",
+        type=int,
+        default=checkpointSize // (1024 * 1024),
+        help="with --checkpoint, MB of input between saves (default: {0})".format(checkpointSize // (1024 * 1024))
+        )
+        
+    parser.add_argument("--stdout",
+        default=False,
+        help="write the output to stdout, not a file. Needs one output, -t s, d or bi, or -l. Other messages are printed to stderr",
+        action="store_true"
+        )
+        
+    parser.add_argument("-o", "--outputBasename",
+        default='output',
+        help="output file name. Must not be a path (default: 'output')"
+        )
+
+    parser.add_argument("infiles", 
+        nargs='*',
+        help="files for input. '-' is stdin"
+        )
+        
+    args = parser.parse_args()
+
+    # assert infiles as absolute paths
+    args.infiles = [f if f == streamPath else os.path.abspath(f) for f in args.infiles]
+    # test infiles exist
+    success = True
+    if (args.infiles.count(streamPath) > 1):
+        printError("stdin ('-') can only be read once")
+        return 1
+    for f in args.infiles:
+        if (f == streamPath):
+            continue
+        if (not os.path.exists(f)):
+            printError('Path not exists path: {0}'.format(f))
+            success = False
+            break
+        if (os.path.isdir(f)):
+            printError('Path is dir path: {0}'.format(f))
+            success = False
+            break
+    if (not success):
+        return 1
+        
+    # test basename is not a path
     if (args.outputBasename.find(os.pathsep) != -1):
         printError('-o outputBasename option appears to be a path: {0}'.format(args.outputBasename))
         return 1
         
-    # set output directory to first inFile arg
-    args.outputBasenamePath = os.path.dirname(args.infiles[0]) 
+    if (not args.infiles and not args.db):
+        printError('no input files')
+        return 1
 
-    print ('Input files:' + str(args.infiles))
-    print ('OutputBasename:' + str(args.outputBasename))
-    print ('OutputBasenamePath:' + str(args.outputBasenamePath))
-    print ('Type:' + str(args.type))
-    print ('Annotate:' + str(args.annotate))
-    print ('LemmaFile:' + str(args.lemmaFile))
+    # set output directory to first inFile arg, or the database, or
+    # for stdin the current directory
+    if (not args.infiles):
+        args.outputBasenamePath = os.path.dirname(os.path.abspath(args.db))
+    elif (args.infiles[0] == streamPath):
+        args.outputBasenamePath = os.getcwd()
+    else:
+        args.outputBasenamePath = os.path.dirname(args.infiles[0])
+
+    # stdout as it was, before any redirect
+    stdout = sys.stdout
+    try:
+        if (args.stdout):
+            # the output has stdout. Everything else is printed to stderr
+            global outputStream
+            outputStream = stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                return _run(args)
+        return _run(args)
+    except BrokenPipeError:
+        # the reader of the output (or of lookups) has gone. Python 
+        # flushes stdout at exit, so point it at devnull
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stdout.fileno())
+        return 1
+
+
+def _run(args):
+    inPath = 'in'
+    if (not args.quiet):
+        print ('Input files:' + str(args.infiles))
+        print ('OutputBasename:' + str(args.outputBasename))
+        print ('OutputBasenamePath:' + str(args.outputBasenamePath))
+        print ('Type:' + str(args.type))
+        print ('Annotate:' + str(args.annotate))
+        print ('Parser:' + str(args.parser))
+        print ('Jobs:' + str(args.jobs))
+        print ('LemmaFile:' + str(args.lemmaFile))
+        print ('WithLemmaFile:' + str(args.withLemmaFile))
 
     
     
     try:
-        processOpts(args)
+        return processOpts(args)
+    except BrokenPipeError:
+        raise
+    except KeyboardInterrupt:
+        printError('interrupted')
+        return 130
     except IOError:
         printError('file would not open: %s' % inPath)
+        return 1
 
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))